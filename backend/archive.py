@@ -0,0 +1,108 @@
+# Перенос старых завершённых договоров в архив и создание секций платежей.
+#
+# Договоры со статусом completed, закончившиеся раньше порога, переносятся
+# вместе с платежами и страховками в contracts_archive, payments_archive и
+# insurances_archive. Рабочие таблицы и их индексы остаются небольшими.
+# Перенос идёт пакетами, каждый пакет — отдельная транзакция; договоры
+# блокируются FOR UPDATE SKIP LOCKED, поэтому перенос не ждёт обработчики и
+# его можно прервать и повторить в любой момент. Сводки аналитики при
+# переносе не меняются (app.skip_summaries) и охватывают всю историю.
+#
+#   python -m backend.archive contracts --older-than-days 730
+#   python -m backend.archive partitions --months-ahead 12
+#
+# Обе команды рассчитаны на запуск по расписанию (например, раз в сутки).
+import argparse
+import logging
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from .models import Contract, Payment, Insurance, PAYMENT_PARTITION_MONTHS_AHEAD, payment_partitions_sql
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_AFTER_DAYS = 730
+
+def _column_names(table):
+    return ", ".join(column.name for column in table.columns)
+
+def _move(table, archive: str, where: str):
+    names = _column_names(table)
+    return text(f"""
+        WITH moved AS (DELETE FROM {table.name} WHERE {where} RETURNING {names})
+        INSERT INTO {archive} ({names}) SELECT {names} FROM moved
+    """)
+
+# Порядок внутри пакета задают внешние ключи: архивные платежи и страховки
+# ссылаются на contracts_archive, рабочие — на contracts. Поэтому договоры
+# сначала копируются в архив, затем переносятся зависимые строки, и только
+# потом договоры удаляются из рабочей таблицы.
+COPY_CONTRACTS = text(f"""
+    INSERT INTO contracts_archive ({_column_names(Contract.__table__)})
+    SELECT {_column_names(Contract.__table__)} FROM contracts WHERE id = ANY(:ids)
+""")
+MOVE_PAYMENTS = _move(Payment.__table__, "payments_archive", "contract_id = ANY(:ids)")
+MOVE_INSURANCES = _move(Insurance.__table__, "insurances_archive", "contract_id = ANY(:ids)")
+DELETE_CONTRACTS = text("DELETE FROM contracts WHERE id = ANY(:ids)")
+
+SELECT_BATCH = text("""
+    SELECT id FROM contracts
+    WHERE status = 'completed' AND end_date < :cutoff
+    ORDER BY id LIMIT :limit
+    FOR UPDATE SKIP LOCKED
+""")
+
+# Один пакет: возвращает число перенесённых договоров
+def archive_batch(engine, cutoff: date, batch_size: int = ARCHIVE_BATCH_SIZE):
+    with engine.begin() as conn:
+        ids = conn.execute(SELECT_BATCH, {"cutoff": cutoff, "limit": batch_size}).scalars().all()
+        if not ids:
+            return 0
+        conn.execute(text("SET LOCAL app.skip_summaries = 'on'"))
+        for statement in (COPY_CONTRACTS, MOVE_PAYMENTS, MOVE_INSURANCES, DELETE_CONTRACTS):
+            conn.execute(statement, {"ids": ids})
+        return len(ids)
+
+def archive_contracts(engine, cutoff: date, batch_size: int = ARCHIVE_BATCH_SIZE):
+    total = 0
+    while True:
+        moved = archive_batch(engine, cutoff, batch_size)
+        if not moved:
+            return total
+        total += moved
+        logger.info("archived %s contracts (%s total)", moved, total)
+
+# Секции платежей от текущего месяца на months_ahead месяцев вперёд, а
+# также для прошлых месяцев, платежи которых попали в payments_default
+# (задним числом через API): они переносятся в созданные секции
+PARTITIONS_START = "LEAST(CURRENT_DATE, (SELECT min(date) FROM payments_default))"
+
+def create_payment_partitions(engine, months_ahead: int = PAYMENT_PARTITION_MONTHS_AHEAD):
+    with engine.begin() as conn:
+        return conn.execute(text(payment_partitions_sql(PARTITIONS_START, months_ahead))).scalar()
+
+def main():
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="Archive old contracts and maintain payment partitions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    contracts = subparsers.add_parser("contracts", help="move old completed contracts to the archive")
+    contracts.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    contracts.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    partitions = subparsers.add_parser("partitions", help="create upcoming monthly payment partitions")
+    partitions.add_argument("--months-ahead", type=int, default=PAYMENT_PARTITION_MONTHS_AHEAD)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "contracts":
+        cutoff = date.today() - timedelta(days=args.older_than_days)
+        total = archive_contracts(engine, cutoff, args.batch_size)
+        print(f"archived {total} contract(s) completed before {cutoff.isoformat()}")
+    else:
+        created = create_payment_partitions(engine, args.months_ahead)
+        print(f"created {created} payment partition(s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Размер и время жизни записей кэша берутся из окружения
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+
+# Кэш в памяти процесса с вытеснением LRU и TTL.
+# Ключи — кортежи, первый элемент которых имя таблицы: это позволяет
+# сбрасывать все записи таблицы после изменения данных в ней.
+class TTLCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate(self, table: str):
+        with self._lock:
+            for key in [k for k in self._data if k[0] == table]:
+                del self._data[key]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL)
@@ -1,11 +1,113 @@
+import os
+import threading
+import time
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from .models import Base
+from .slow_queries import attach_slow_query_log
+
+# Параметры подключения и пула берутся из окружения, чтобы размер пула
+# можно было подбирать под число воркеров без правки кода
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres")
+# Тот же DSN, но через драйвер asyncpg для асинхронных обработчиков. Драйвер
+# заменяется в разобранном адресе, поэтому подходят и postgres://, и адреса с
+# явным драйвером (postgresql+psycopg2://). Отдельный адрес можно задать
+# переменной ASYNC_DATABASE_URL.
+def async_database_url(url: str):
+    return make_url(url).set(drivername="postgresql+asyncpg")
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
+
+# Статистика ожидания соединений из пула
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self, pool):
+        with self._lock:
+            return {
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": POOL_MAX_OVERFLOW,
+                "waits": self.waits,
+                "wait_avg_ms": self.wait_total / self.waits * 1000 if self.waits else 0.0,
+                "wait_max_ms": self.wait_max * 1000,
+                "timeouts": self.timeouts,
+            }
+
+# Замер времени ожидания соединения из пула. Ожиданием считается только
+# получение при исчерпанном пуле (заняты size + max_overflow соединений):
+# иначе _do_get берёт свободное соединение или открывает новое, и время
+# установки соединения не должно попадать в метрику насыщения пула.
+class WaitTimingMixin:
+    def _saturated(self):
+        return self._max_overflow > -1 and self.checkedout() >= self.size() + self._max_overflow
 
-DATABASE_URL = "postgresql://postgres"
+    def _do_get(self):
+        if not self._saturated():
+            return super()._do_get()
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record_wait(time.perf_counter() - started)
+        return conn
 
-engine = create_engine(DATABASE_URL)
+class InstrumentedQueuePool(WaitTimingMixin, QueuePool):
+    stats = PoolStats()
+
+class InstrumentedAsyncQueuePool(WaitTimingMixin, AsyncAdaptedQueuePool):
+    stats = PoolStats()
+
+POOL_OPTIONS = dict(
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_recycle=POOL_RECYCLE,
+    pool_pre_ping=POOL_PRE_PING,
+)
+
+engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool, **POOL_OPTIONS)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncQueuePool, **POOL_OPTIONS)
+
+# Журнал медленных запросов (включается переменной SLOW_QUERY_MS)
+attach_slow_query_log(engine)
+attach_slow_query_log(async_engine.sync_engine)
+
+metadata = Base.metadata
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
 def get_db():
     db = SessionLocal()
@@ -13,3 +115,15 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Асинхронная сессия для обработчиков async def: ожидание ответа Postgres
+# не занимает поток из пула FastAPI
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def pool_status():
+    return {
+        "sync": engine.pool.stats.snapshot(engine.pool),
+        "async": async_engine.pool.stats.snapshot(async_engine.pool),
+    }
@@ -1,11 +1,31 @@
 from datetime import date
-from typing import List
-from fastapi import Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
-
-from .database import get_db
+from typing import List, Literal, Optional
+from fastapi import Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .cache import cache
+from .database import get_db, get_async_db, pool_status
+from .etag import etag_for, table_versions
+from .export import stream_export
+from .metrics import metrics
+from .slow_queries import slow_query_log
+from .projections import (
+    BRAND_FIELDS, MODEL_FIELDS, PARKING_FIELDS, EMPLOYEE_FIELDS, PAYMENT_FIELDS,
+    CLIENT_FIELDS, CAR_FIELDS, columns, flat_select, join_car_names, cars_select, contracts_select,
+    insurances_select, maintenances_select, written_contract_select, written_insurance_select,
+    written_maintenance_select, written_car_select, flat_row, contract_row, insurance_row, maintenance_row
+)
+from .utilization import MAX_UTILIZATION_DAYS, load_intervals, utilization_report
+from .serializers import fast_json
 from .models import (
-    Brand, Model, Parking, Employee, Payment, Insurance, Maintenance, Client, Car, Contract
+    Brand, Model, Parking, Employee, Payment, Insurance, Maintenance, Client, Car, Contract,
+    RevenueByMonth, RevenueByCar, MaintenanceByCar, MaintenanceByMonth, CONTRACT_OVERLAP_CONSTRAINT
 )
 
 from .schemas import (
@@ -13,652 +33,961 @@ from .schemas import (
     EmployeeCreate, EmployeeResponse, PaymentCreate, PaymentResponse,
     ClientResponse, ClientCreate, CarResponse, CarCreate, CarUpdate,
     ContractResponse, ContractCreate, InsuranceCreate, InsuranceResponse,
-    MaintenanceCreate, MaintenanceResponse
+    MaintenanceCreate, MaintenanceResponse, BulkItemResult,
+    RevenueMonthResponse, RevenueCarResponse, ContractSummaryResponse,
+    MaintenanceCarSummaryResponse, MaintenanceMonthSummaryResponse
 )
 
+# Максимальный размер страницы для списков
+MAX_PAGE_LIMIT = 1000
+
+# Keyset-пагинация по id: WHERE id > after ORDER BY id LIMIT n.
+# Курсор следующей страницы возвращается в заголовке X-Next-Cursor.
+async def paginate(db: AsyncSession, stmt, id_column, response: Response, limit: Optional[int], after: Optional[int]):
+    stmt = stmt.order_by(id_column)
+    if after is not None:
+        stmt = stmt.filter(id_column > after)
+    if limit is None:
+        return (await db.execute(stmt)).all()
+    rows = (await db.execute(stmt.limit(limit + 1))).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return rows
+
+# Максимальное число записей в одном пакетном запросе
+MAX_BULK_SIZE = 1000
+
+def check_bulk_size(items: list):
+    if len(items) > MAX_BULK_SIZE:
+        raise HTTPException(status_code=400, detail=f"Too many items, max {MAX_BULK_SIZE}")
+
+# Все валидные строки вставляются пакетной INSERT ... RETURNING id в одной
+# транзакции; полученные id раздаются элементам без ошибок по порядку.
+# Postgres не гарантирует порядок строк RETURNING, поэтому SQLAlchemy
+# (insertmanyvalues) сортирует их по порядку параметров.
+def bulk_insert(db: Session, model, rows: list, results: List[BulkItemResult], conflict_detail: str):
+    if rows:
+        try:
+            stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+            ids = db.execute(stmt, rows).scalars().all()
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            raise integrity_error(e, 400, conflict_detail)
+        ids = iter(ids)
+        for result in results:
+            if result.error is None:
+                result.id = next(ids)
+    return results
+
+# Ограничения, нарушение которых имеет собственный ответ независимо от
+# обработчика: имя ограничения -> (статус, сообщение)
+CONSTRAINT_ERRORS = {
+    CONTRACT_OVERLAP_CONSTRAINT: (409, "Car is already rented for these dates"),
+}
+
+# Внешние ключи автомобиля на справочники: нарушение означает, что id марки
+# или модели из кэша устарел (запись удалили в другом процессе).
+# Имя ограничения -> таблица справочника
+CAR_REFERENCE_CONSTRAINTS = {
+    "cars_brand_id_fkey": "brands",
+    "cars_model_id_fkey": "models",
+}
+
+class StaleReferenceError(HTTPException):
+    pass
+
+def constraint_name(e: IntegrityError):
+    return getattr(getattr(e.orig, "diag", None), "constraint_name", None)
+
+# Ответ на нарушение ограничения; при устаревшей ссылке на справочник его
+# id сразу убираются из кэша
+def integrity_error(e: IntegrityError, conflict_status: int, conflict_detail: str):
+    constraint = constraint_name(e)
+    if constraint in CAR_REFERENCE_CONSTRAINTS:
+        cache.invalidate(CAR_REFERENCE_CONSTRAINTS[constraint])
+        return StaleReferenceError(status_code=409, detail="Car brand or model was deleted, retry the request")
+    status_code, detail = CONSTRAINT_ERRORS.get(constraint, (conflict_status, conflict_detail))
+    return HTTPException(status_code=status_code, detail=detail)
+
+# Запись одним запросом: INSERT/UPDATE ... RETURNING сразу отдаёт данные для
+# ответа. Нарушение ограничения (уникальность, внешний ключ) превращается
+# в ответ с conflict_status. None — ни одна строка не изменена.
+def write_returning(db: Session, stmt, conflict_status: int, conflict_detail: str):
+    try:
+        row = db.execute(stmt).first()
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise integrity_error(e, conflict_status, conflict_detail)
+    return row
+
+# Создание записи с уникальным полем без предварительного SELECT:
+# INSERT ... ON CONFLICT DO NOTHING RETURNING. Пустой результат означает, что
+# запись с таким значением уже есть (проверку выполняет уникальный индекс,
+# поэтому она корректна и при параллельных запросах).
+def insert_unique(db: Session, model, values: dict, unique_column, fields, conflict_detail: str, written_select=None):
+    stmt = pg_insert(model).values(**values).on_conflict_do_nothing(index_elements=[unique_column])
+    stmt = written_select(stmt) if written_select else stmt.returning(*columns(fields))
+    row = write_returning(db, stmt, 400, conflict_detail)
+    if row is None:
+        raise HTTPException(status_code=400, detail=conflict_detail)
+    return row
+
+# DELETE ... RETURNING id вместо чтения записи перед удалением
+def delete_returning(db: Session, model, record_id: int, name: str):
+    row = write_returning(
+        db, delete(model).where(model.id == record_id).returning(model.id),
+        409, f"{name} is referenced by other records",
+    )
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"{name} not found")
+
+def contract_values(contract: ContractCreate):
+    start_date = date.fromisoformat(contract.start_date)
+    end_date = date.fromisoformat(contract.end_date)
+    # daterange в ограничении исключения не допускает обратного периода
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="End date must not be before start date")
+    return {
+        "client_id": contract.client_id,
+        "car_id": contract.car_id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "payment_date": date.fromisoformat(contract.payment_date),
+        "amount": contract.amount,
+    }
+
+# Фильтр по диапазону дат (границы включительно)
+def filter_date_range(query, column, date_from: Optional[date], date_to: Optional[date]):
+    if date_from is not None:
+        query = query.filter(column >= date_from)
+    if date_to is not None:
+        query = query.filter(column <= date_to)
+    return query
+
+ExportFormat = Literal["ndjson", "csv"]
+
+# Автомобили без активных договоров, пересекающихся с периодом [start, end].
+# Активные договоры одного автомобиля не пересекаются (contracts_car_period_excl),
+# поэтому с периодом может пересечься только последний договор, начатый не
+# позже end: для каждого автомобиля это один спуск по индексу
+# ix_contracts_active_car_period вместо перебора всех его договоров до end.
+def available_cars_select(start: date, end: date):
+    latest_end = (
+        select(Contract.end_date)
+        .where(
+            Contract.car_id == Car.id,
+            Contract.status == "active",
+            Contract.start_date <= end,
+        )
+        .order_by(Contract.start_date.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return cars_select().where((latest_end >= start).isnot(True)).order_by(Car.id)
+
+# Марка и модель автомобиля приходят названиями. Id справочника берётся из
+# кэша, а отсутствующие названия добавляются (INSERT ... ON CONFLICT DO
+# NOTHING) в транзакции записи автомобиля. В кэш попадают только id уже
+# существовавших записей: вставленные могут быть откачены вместе с автомобилем.
+# Возвращает {название: id} и признак того, что справочник изменился.
+def reference_ids(db: Session, model, names):
+    table = model.__tablename__
+    ids, missing = {}, []
+    for name in set(names):
+        record_id = cache.get((table, "id", name))
+        if record_id is None:
+            missing.append(name)
+        else:
+            ids[name] = record_id
+    if not missing:
+        return ids, False
+    inserted = set(db.execute(
+        pg_insert(model).values([{"name": name} for name in missing])
+        .on_conflict_do_nothing(index_elements=[model.name])
+        .returning(model.name)
+    ).scalars())
+    for name, record_id in db.execute(select(model.name, model.id).where(model.name.in_(missing))):
+        ids[name] = record_id
+        if name not in inserted:
+            cache.set((table, "id", name), record_id)
+    return ids, bool(inserted)
+
+def car_values(car: CarCreate, brand_ids: dict, model_ids: dict):
+    values = car.dict(exclude={"brand", "model"})
+    values["brand_id"] = brand_ids[car.brand]
+    values["model_id"] = model_ids[car.model]
+    return values
+
+def resolve_car_references(db: Session, cars: List[CarCreate]):
+    brand_ids, brands_created = reference_ids(db, Brand, [c.brand for c in cars])
+    model_ids, models_created = reference_ids(db, Model, [c.model for c in cars])
+    created = [table for table, flag in (("brands", brands_created), ("models", models_created)) if flag]
+    return brand_ids, model_ids, created
+
+# Id марки или модели из кэша устаревает, если запись справочника удалили в
+# другом процессе: вставка автомобиля нарушает внешний ключ
+# (StaleReferenceError, кэш справочника уже сброшен). Запись повторяется
+# один раз с id из базы.
+def retry_stale_references(write):
+    try:
+        return write()
+    except StaleReferenceError:
+        return write()
+
+# Справочники меняются редко: страницы списков берутся из кэша процесса,
+# а изменения в таблице сбрасывают все её записи. В ключ входит версия
+# таблицы из table_versions (прочитанная etag_for до выборки), поэтому
+# запись из другого процесса или импорта сразу даёт промах кэша.
+async def cached_list(db: AsyncSession, request: Request, table: str, fields, id_column, response: Response, limit: Optional[int], after: Optional[int]):
+    versions = getattr(request.state, "table_versions", None)
+    if versions is None:
+        versions = await table_versions(db, [table])
+    key = (table, "list", versions.get(table, 0), limit, after)
+    page = cache.get(key)
+    if page is None:
+        rows = await paginate(db, flat_select(fields), id_column, response, limit, after)
+        page = ([flat_row(r) for r in rows], response.headers.get("X-Next-Cursor"))
+        cache.set(key, page)
+    content, next_cursor = page
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return fast_json(content, response)
+
+# Проверка существования записи по id без запроса к базе, если она уже
+# встречалась. Кэшируются только найденные записи; удаление сбрасывает ключ.
+def record_exists(db: Session, model, record_id: int) -> bool:
+    key = (model.__tablename__, record_id)
+    if cache.get(key):
+        return True
+    found = db.query(model.id).filter(model.id == record_id).first() is not None
+    if found:
+        cache.set(key, True)
+    return found
+
+# Максимальное число результатов поиска
+MAX_SEARCH_LIMIT = 100
+
+# Поиск по фрагменту: ILIKE '%q%' по любому из столбцов (через триграммные
+# GIN-индексы) или похожесть pg_trgm для опечаток; сортировка по наибольшей
+# похожести среди столбцов
+def search_select(fields, search_columns, q: str, limit: int):
+    pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    matches = [column.ilike(pattern, escape="\\") for column in search_columns]
+    matches += [column.bool_op("%")(q) for column in search_columns]
+    rank = func.greatest(*[func.similarity(column, q) for column in search_columns])
+    return flat_select(fields).where(or_(*matches)).order_by(rank.desc(), fields["id"]).limit(limit)
+
 # Эндпоинты для марок автомобилей
 def setup_brand_endpoints(app):
-    @app.get("/brands", response_model=List[BrandResponse])
-    def get_brands(db: Session = Depends(get_db)):
-        return db.query(Brand).all()
+    @app.get("/brands", response_model=List[BrandResponse], dependencies=[etag_for("brands")])
+    async def get_brands(
+        request: Request,
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+        after: Optional[int] = Query(None, ge=0),
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        return await cached_list(db, request, "brands", BRAND_FIELDS, Brand.id, response, limit, after)
 
     @app.post("/brands", response_model=BrandResponse)
     def create_brand(brand: BrandCreate, db: Session = Depends(get_db)):
-        existing = db.query(Brand).filter(Brand.name == brand.name).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Brand already exists")
-        db_brand = Brand(**brand.dict())
-        db.add(db_brand)
-        db.commit()
-        db.refresh(db_brand)
-        return db_brand
+        row = insert_unique(db, Brand, brand.dict(), Brand.name, BRAND_FIELDS, "Brand already exists")
+        cache.invalidate("brands")
+        return fast_json(flat_row(row))
 
     @app.put("/brands/{brand_id}", response_model=BrandResponse)
     def update_brand(brand_id: int, brand: BrandCreate, db: Session = Depends(get_db)):
-        db_brand = db.query(Brand).filter(Brand.id == brand_id).first()
-        if not db_brand:
+        stmt = update(Brand).where(Brand.id == brand_id).values(name=brand.name).returning(*columns(BRAND_FIELDS))
+        row = write_returning(db, stmt, 400, "Brand already exists")
+        if row is None:
             raise HTTPException(status_code=404, detail="Brand not found")
-        db_brand.name = brand.name
-        db.commit()
-        db.refresh(db_brand)
-        return db_brand
+        cache.invalidate("brands")
+        return fast_json(flat_row(row))
 
     @app.delete("/brands/{brand_id}")
     def delete_brand(brand_id: int, db: Session = Depends(get_db)):
-        db_brand = db.query(Brand).filter(Brand.id == brand_id).first()
-        if not db_brand:
-            raise HTTPException(status_code=404, detail="Brand not found")
-        db.delete(db_brand)
-        db.commit()
+        delete_returning(db, Brand, brand_id, "Brand")
+        cache.invalidate("brands")
         return {"message": "Brand deleted"}
 
 # Эндпоинты для моделей автомобилей
 def setup_model_endpoints(app):
-    @app.get("/models", response_model=List[ModelResponse])
-    def get_models(db: Session = Depends(get_db)):
-        return db.query(Model).all()
+    @app.get("/models", response_model=List[ModelResponse], dependencies=[etag_for("models")])
+    async def get_models(
+        request: Request,
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+        after: Optional[int] = Query(None, ge=0),
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        return await cached_list(db, request, "models", MODEL_FIELDS, Model.id, response, limit, after)
 
     @app.post("/models", response_model=ModelResponse)
     def create_model(model: ModelCreate, db: Session = Depends(get_db)):
-        existing = db.query(Model).filter(Model.name == model.name).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Model already exists")
-        db_model = Model(**model.dict())
-        db.add(db_model)
-        db.commit()
-        db.refresh(db_model)
-        return db_model
+        row = insert_unique(db, Model, model.dict(), Model.name, MODEL_FIELDS, "Model already exists")
+        cache.invalidate("models")
+        return fast_json(flat_row(row))
 
     @app.put("/models/{model_id}", response_model=ModelResponse)
     def update_model(model_id: int, model: ModelCreate, db: Session = Depends(get_db)):
-        db_model = db.query(Model).filter(Model.id == model_id).first()
-        if not db_model:
+        stmt = update(Model).where(Model.id == model_id).values(name=model.name).returning(*columns(MODEL_FIELDS))
+        row = write_returning(db, stmt, 400, "Model already exists")
+        if row is None:
             raise HTTPException(status_code=404, detail="Model not found")
-        db_model.name = model.name
-        db.commit()
-        db.refresh(db_model)
-        return db_model
+        cache.invalidate("models")
+        return fast_json(flat_row(row))
 
     @app.delete("/models/{model_id}")
     def delete_model(model_id: int, db: Session = Depends(get_db)):
-        db_model = db.query(Model).filter(Model.id == model_id).first()
-        if not db_model:
-            raise HTTPException(status_code=404, detail="Model not found")
-        db.delete(db_model)
-        db.commit()
+        delete_returning(db, Model, model_id, "Model")
+        cache.invalidate("models")
         return {"message": "Model deleted"}
 
 # Эндпоинты для паркингов
 def setup_parking_endpoints(app):
-    @app.get("/parkings", response_model=List[ParkingResponse])
-    def get_parkings(db: Session = Depends(get_db)):
-        return db.query(Parking).all()
+    @app.get("/parkings", response_model=List[ParkingResponse], dependencies=[etag_for("parkings")])
+    async def get_parkings(
+        request: Request,
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+        after: Optional[int] = Query(None, ge=0),
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        return await cached_list(db, request, "parkings", PARKING_FIELDS, Parking.id, response, limit, after)
 
     @app.post("/parkings", response_model=ParkingResponse)
     def create_parking(parking: ParkingCreate, db: Session = Depends(get_db)):
-        existing = db.query(Parking).filter(Parking.name == parking.name).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Parking already exists")
-        db_parking = Parking(**parking.dict())
-        db.add(db_parking)
-        db.commit()
-        db.refresh(db_parking)
-        return db_parking
+        row = insert_unique(db, Parking, parking.dict(), Parking.name, PARKING_FIELDS, "Parking already exists")
+        cache.invalidate("parkings")
+        return fast_json(flat_row(row))
 
     @app.put("/parkings/{parking_id}", response_model=ParkingResponse)
     def update_parking(parking_id: int, parking: ParkingCreate, db: Session = Depends(get_db)):
-        db_parking = db.query(Parking).filter(Parking.id == parking_id).first()
-        if not db_parking:
+        stmt = update(Parking).where(Parking.id == parking_id).values(name=parking.name).returning(*columns(PARKING_FIELDS))
+        row = write_returning(db, stmt, 400, "Parking already exists")
+        if row is None:
             raise HTTPException(status_code=404, detail="Parking not found")
-        db_parking.name = parking.name
-        db.commit()
-        db.refresh(db_parking)
-        return db_parking
+        cache.invalidate("parkings")
+        return fast_json(flat_row(row))
 
     @app.delete("/parkings/{parking_id}")
     def delete_parking(parking_id: int, db: Session = Depends(get_db)):
-        db_parking = db.query(Parking).filter(Parking.id == parking_id).first()
-        if not db_parking:
-            raise HTTPException(status_code=404, detail="Parking not found")
-        db.delete(db_parking)
-        db.commit()
+        delete_returning(db, Parking, parking_id, "Parking")
+        cache.invalidate("parkings")
         return {"message": "Parking deleted"}
 
 # Эндпоинты для сотрудников
 def setup_employee_endpoints(app):
-    @app.get("/employees", response_model=List[EmployeeResponse])
-    def get_employees(db: Session = Depends(get_db)):
-        return db.query(Employee).all()
+    @app.get("/employees", response_model=List[EmployeeResponse], dependencies=[etag_for("employees")])
+    async def get_employees(
+        request: Request,
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+        after: Optional[int] = Query(None, ge=0),
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        return await cached_list(db, request, "employees", EMPLOYEE_FIELDS, Employee.id, response, limit, after)
 
     @app.post("/employees", response_model=EmployeeResponse)
     def create_employee(employee: EmployeeCreate, db: Session = Depends(get_db)):
-        existing = db.query(Employee).filter(Employee.full_name == employee.full_name).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Employee already exists")
-        db_employee = Employee(**employee.dict())
-        db.add(db_employee)
-        db.commit()
-        db.refresh(db_employee)
-        return db_employee
+        row = insert_unique(db, Employee, employee.dict(), Employee.full_name, EMPLOYEE_FIELDS, "Employee already exists")
+        cache.invalidate("employees")
+        return fast_json(flat_row(row))
 
     @app.put("/employees/{employee_id}", response_model=EmployeeResponse)
     def update_employee(employee_id: int, employee: EmployeeCreate, db: Session = Depends(get_db)):
-        db_employee = db.query(Employee).filter(Employee.id == employee_id).first()
-        if not db_employee:
+        stmt = update(Employee).where(Employee.id == employee_id).values(full_name=employee.full_name).returning(*columns(EMPLOYEE_FIELDS))
+        row = write_returning(db, stmt, 400, "Employee already exists")
+        if row is None:
             raise HTTPException(status_code=404, detail="Employee not found")
-        db_employee.full_name = employee.full_name
-        db.commit()
-        db.refresh(db_employee)
-        return db_employee
+        cache.invalidate("employees")
+        return fast_json(flat_row(row))
 
     @app.delete("/employees/{employee_id}")
     def delete_employee(employee_id: int, db: Session = Depends(get_db)):
-        db_employee = db.query(Employee).filter(Employee.id == employee_id).first()
-        if not db_employee:
-            raise HTTPException(status_code=404, detail="Employee not found")
-        db.delete(db_employee)
-        db.commit()
+        delete_returning(db, Employee, employee_id, "Employee")
+        cache.invalidate("employees")
         return {"message": "Employee deleted"}
 
 # Эндпоинты для платежей
 def setup_payment_endpoints(app):
-    @app.get("/payments", response_model=List[PaymentResponse])
-    def get_payments(db: Session = Depends(get_db)):
-        return db.query(Payment).all()
+    @app.get("/payments", response_model=List[PaymentResponse], dependencies=[etag_for("payments")])
+    async def get_payments(
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+        after: Optional[int] = Query(None, ge=0),
+        contract_id: Optional[int] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        stmt = flat_select(PAYMENT_FIELDS)
+        if contract_id is not None:
+            stmt = stmt.filter(Payment.contract_id == contract_id)
+        stmt = filter_date_range(stmt, Payment.date, date_from, date_to)
+        rows = await paginate(db, stmt, Payment.id, response, limit, after)
+        return fast_json([flat_row(r) for r in rows], response)
+
+    @app.get("/payments/export")
+    def export_payments(fmt: ExportFormat = Query("ndjson", alias="format")):
+        return stream_export(
+            flat_select(PAYMENT_FIELDS).order_by(Payment.id),
+            flat_row, fmt, "payments",
+        )
+
+    @app.post("/payments/bulk", response_model=List[BulkItemResult])
+    def create_payments_bulk(payments: List[PaymentCreate], db: Session = Depends(get_db)):
+        check_bulk_size(payments)
+        # Проверка существования договоров одним запросом
+        contract_ids = {p.contract_id for p in payments}
+        existing = set(db.execute(select(Contract.id).where(Contract.id.in_(contract_ids))).scalars())
+        results, rows = [], []
+        for i, payment in enumerate(payments):
+            if payment.contract_id not in existing:
+                results.append(BulkItemResult(index=i, error="Contract not found"))
+                continue
+            try:
+                payment_date = date.fromisoformat(payment.date)
+            except ValueError:
+                results.append(BulkItemResult(index=i, error="Invalid date"))
+                continue
+            rows.append({"contract_id": payment.contract_id, "date": payment_date, "amount": payment.amount})
+            results.append(BulkItemResult(index=i))
+        return bulk_insert(db, Payment, rows, results, "Contract not found")
 
     @app.post("/payments", response_model=PaymentResponse)
     def create_payment(payment: PaymentCreate, db: Session = Depends(get_db)):
         # Проверка существования договора
-        contract = db.query(Contract).filter(Contract.id == payment.contract_id).first()
-        if not contract:
+        if not record_exists(db, Contract, payment.contract_id):
             raise HTTPException(status_code=404, detail="Contract not found")
-        db_payment = Payment(**payment.dict())
-        db.add(db_payment)
-        db.commit()
-        db.refresh(db_payment)
-        return db_payment
+        stmt = insert(Payment).values(
+            contract_id=payment.contract_id,
+            date=date.fromisoformat(payment.date),
+            amount=payment.amount,
+        ).returning(*columns(PAYMENT_FIELDS))
+        row = write_returning(db, stmt, 404, "Contract not found")
+        return fast_json(flat_row(row))
 
     @app.put("/payments/{payment_id}", response_model=PaymentResponse)
     def update_payment(payment_id: int, payment: PaymentCreate, db: Session = Depends(get_db)):
-        db_payment = db.query(Payment).filter(Payment.id == payment_id).first()
-        if not db_payment:
+        stmt = update(Payment).where(Payment.id == payment_id).values(
+            contract_id=payment.contract_id,
+            date=date.fromisoformat(payment.date),
+            amount=payment.amount,
+        ).returning(*columns(PAYMENT_FIELDS))
+        row = write_returning(db, stmt, 404, "Contract not found")
+        if row is None:
             raise HTTPException(status_code=404, detail="Payment not found")
-        db_payment.contract_id = payment.contract_id
-        db_payment.date = date.fromisoformat(payment.date)
-        db_payment.amount = payment.amount
-        db.commit()
-        db.refresh(db_payment)
-        return db_payment
+        return fast_json(flat_row(row))
 
     @app.delete("/payments/{payment_id}")
     def delete_payment(payment_id: int, db: Session = Depends(get_db)):
-        db_payment = db.query(Payment).filter(Payment.id == payment_id).first()
-        if not db_payment:
-            raise HTTPException(status_code=404, detail="Payment not found")
-        db.delete(db_payment)
-        db.commit()
+        delete_returning(db, Payment, payment_id, "Payment")
         return {"message": "Payment deleted"}
 
 # Эндпоинты для страховок
 def setup_insurance_endpoints(app):
-    @app.get("/insurances", response_model=List[InsuranceResponse])
-    def get_insurances(db: Session = Depends(get_db)):
-        insurances = db.query(Insurance).options(joinedload(Insurance.contract).joinedload(Contract.client), joinedload(Insurance.contract).joinedload(Contract.car)).all()
-        return [
-            InsuranceResponse(
-                id=i.id,
-                contract=ContractResponse(
-                    id=i.contract.id,
-                    client=ClientResponse(
-                        id=i.contract.client.id,
-                        full_name=i.contract.client.full_name,
-                        phone=i.contract.client.phone,
-                        license_number=i.contract.client.license_number,
-                        birth_date=str(i.contract.client.birth_date) if i.contract.client.birth_date else None
-                    ),
-                    car=CarResponse(
-                        id=i.contract.car.id,
-                        brand=i.contract.car.brand,
-                        model=i.contract.car.model,
-                        year=i.contract.car.year,
-                        color=i.contract.car.color,
-                        license_plate=i.contract.car.plate,
-                        price=i.contract.car.price
-                    ),
-                    start_date=str(i.contract.start_date),
-                    end_date=str(i.contract.end_date),
-                    payment_date=str(i.contract.payment_date),
-                    amount=i.contract.amount,
-                    status=i.contract.status
-                ),
-                cost=i.cost
-            ) for i in insurances
-        ]
+    @app.get("/insurances", response_model=List[InsuranceResponse], dependencies=[etag_for("insurances", "contracts", "clients", "cars", "brands", "models")])
+    async def get_insurances(
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+        after: Optional[int] = Query(None, ge=0),
+        contract_id: Optional[int] = None,
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        stmt = insurances_select()
+        if contract_id is not None:
+            stmt = stmt.filter(Insurance.contract_id == contract_id)
+        rows = await paginate(db, stmt, Insurance.id, response, limit, after)
+        return fast_json([insurance_row(r) for r in rows], response)
 
     @app.post("/insurances", response_model=InsuranceResponse)
     def create_insurance(insurance: InsuranceCreate, db: Session = Depends(get_db)):
-        contract = db.query(Contract).filter(Contract.id == insurance.contract_id).first()
-        if not contract:
+        if not record_exists(db, Contract, insurance.contract_id):
             raise HTTPException(status_code=404, detail="Contract not found")
-        db_insurance = Insurance(**insurance.dict())
-        db.add(db_insurance)
-        db.commit()
-        db.refresh(db_insurance)
-        # Возвращаем полный объект с joinedload
-        full_insurance = db.query(Insurance).options(joinedload(Insurance.contract).joinedload(Contract.client), joinedload(Insurance.contract).joinedload(Contract.car)).filter(Insurance.id == db_insurance.id).first()
-        return InsuranceResponse(
-            id=full_insurance.id,
-            contract=ContractResponse(
-                id=full_insurance.contract.id,
-                client=ClientResponse(
-                    id=full_insurance.contract.client.id,
-                    full_name=full_insurance.contract.client.full_name,
-                    phone=full_insurance.contract.client.phone,
-                    license_number=full_insurance.contract.client.license_number,
-                    birth_date=str(full_insurance.contract.client.birth_date) if full_insurance.contract.client.birth_date else None
-                ),
-                car=CarResponse(
-                    id=full_insurance.contract.car.id,
-                    brand=full_insurance.contract.car.brand,
-                    model=full_insurance.contract.car.model,
-                    year=full_insurance.contract.car.year,
-                    color=full_insurance.contract.car.color,
-                    license_plate=full_insurance.contract.car.plate,
-                    price=full_insurance.contract.car.price
-                ),
-                start_date=str(full_insurance.contract.start_date),
-                end_date=str(full_insurance.contract.end_date),
-                payment_date=str(full_insurance.contract.payment_date),
-                amount=full_insurance.contract.amount,
-                status=full_insurance.contract.status
-            ),
-            cost=full_insurance.cost
-        )
+        stmt = written_insurance_select(insert(Insurance).values(**insurance.dict()))
+        row = write_returning(db, stmt, 404, "Contract not found")
+        return fast_json(insurance_row(row))
 
     @app.put("/insurances/{insurance_id}", response_model=InsuranceResponse)
     def update_insurance(insurance_id: int, insurance: InsuranceCreate, db: Session = Depends(get_db)):
-        db_insurance = db.query(Insurance).filter(Insurance.id == insurance_id).first()
-        if not db_insurance:
-            raise HTTPException(status_code=404, detail="Insurance not found")
-        db_insurance.contract_id = insurance.contract_id
-        db_insurance.cost = insurance.cost
-        db.commit()
-        db.refresh(db_insurance)
-        # Возвращаем полный объект
-        full_insurance = db.query(Insurance).options(joinedload(Insurance.contract).joinedload(Contract.client), joinedload(Insurance.contract).joinedload(Contract.car)).filter(Insurance.id == db_insurance.id).first()
-        return InsuranceResponse(
-            id=full_insurance.id,
-            contract=ContractResponse(
-                id=full_insurance.contract.id,
-                client=ClientResponse(
-                    id=full_insurance.contract.client.id,
-                    full_name=full_insurance.contract.client.full_name,
-                    phone=full_insurance.contract.client.phone,
-                    license_number=full_insurance.contract.client.license_number,
-                    birth_date=str(full_insurance.contract.client.birth_date) if full_insurance.contract.client.birth_date else None
-                ),
-                car=CarResponse(
-                    id=full_insurance.contract.car.id,
-                    brand=full_insurance.contract.car.brand,
-                    model=full_insurance.contract.car.model,
-                    year=full_insurance.contract.car.year,
-                    color=full_insurance.contract.car.color,
-                    license_plate=full_insurance.contract.car.plate,
-                    price=full_insurance.contract.car.price
-                ),
-                start_date=str(full_insurance.contract.start_date),
-                end_date=str(full_insurance.contract.end_date),
-                payment_date=str(full_insurance.contract.payment_date),
-                amount=full_insurance.contract.amount,
-                status=full_insurance.contract.status
-            ),
-            cost=full_insurance.cost
+        stmt = written_insurance_select(
+            update(Insurance).where(Insurance.id == insurance_id).values(**insurance.dict())
         )
+        row = write_returning(db, stmt, 404, "Contract not found")
+        if row is None:
+            raise HTTPException(status_code=404, detail="Insurance not found")
+        return fast_json(insurance_row(row))
 
     @app.delete("/insurances/{insurance_id}")
     def delete_insurance(insurance_id: int, db: Session = Depends(get_db)):
-        db_insurance = db.query(Insurance).filter(Insurance.id == insurance_id).first()
-        if not db_insurance:
-            raise HTTPException(status_code=404, detail="Insurance not found")
-        db.delete(db_insurance)
-        db.commit()
+        delete_returning(db, Insurance, insurance_id, "Insurance")
         return {"message": "Insurance deleted"}
 # Эндпоинты для обслуживания автомобилей
 def setup_maintenance_endpoints(app):
-    @app.get("/maintenances", response_model=List[MaintenanceResponse])
-    def get_maintenances(db: Session = Depends(get_db)):
-        maintenances = db.query(Maintenance).options(joinedload(Maintenance.car)).all()
-        return [
-            MaintenanceResponse(
-                id=m.id,
-                car=CarResponse(
-                    id=m.car.id,
-                    brand=m.car.brand,
-                    model=m.car.model,
-                    year=m.car.year,
-                    color=m.car.color,
-                    license_plate=m.car.plate,
-                    price=m.car.price
-                ),
-                description=m.description,
-                date=str(m.date),
-                cost=m.cost
-            ) for m in maintenances
-        ]
+    @app.get("/maintenances", response_model=List[MaintenanceResponse], dependencies=[etag_for("maintenances", "cars", "brands", "models")])
+    async def get_maintenances(
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+        after: Optional[int] = Query(None, ge=0),
+        car_id: Optional[int] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        stmt = maintenances_select()
+        if car_id is not None:
+            stmt = stmt.filter(Maintenance.car_id == car_id)
+        stmt = filter_date_range(stmt, Maintenance.date, date_from, date_to)
+        rows = await paginate(db, stmt, Maintenance.id, response, limit, after)
+        return fast_json([maintenance_row(r) for r in rows], response)
+
+    @app.get("/maintenances/export")
+    def export_maintenances(fmt: ExportFormat = Query("ndjson", alias="format")):
+        return stream_export(
+            maintenances_select().order_by(Maintenance.id),
+            maintenance_row, fmt, "maintenances",
+        )
 
     @app.post("/maintenances", response_model=MaintenanceResponse)
     def create_maintenance(maintenance: MaintenanceCreate, db: Session = Depends(get_db)):
-        car = db.query(Car).filter(Car.id == maintenance.car_id).first()
-        if not car:
+        if not record_exists(db, Car, maintenance.car_id):
             raise HTTPException(status_code=404, detail="Car not found")
-        db_maintenance = Maintenance(**maintenance.dict())
-        db_maintenance.date = date.fromisoformat(maintenance.date)
-        db.add(db_maintenance)
-        db.commit()
-        db.refresh(db_maintenance)
-        # Возвращаем полный объект
-        full_maintenance = db.query(Maintenance).options(joinedload(Maintenance.car)).filter(Maintenance.id == db_maintenance.id).first()
-        return MaintenanceResponse(
-            id=full_maintenance.id,
-            car=CarResponse(
-                id=full_maintenance.car.id,
-                brand=full_maintenance.car.brand,
-                model=full_maintenance.car.model,
-                year=full_maintenance.car.year,
-                color=full_maintenance.car.color,
-                license_plate=full_maintenance.car.plate,
-                price=full_maintenance.car.price
-            ),
-            description=full_maintenance.description,
-            date=str(full_maintenance.date),
-            cost=full_maintenance.cost
+        stmt = written_maintenance_select(
+            insert(Maintenance).values(
+                car_id=maintenance.car_id,
+                description=maintenance.description,
+                date=date.fromisoformat(maintenance.date),
+                cost=maintenance.cost,
+            )
         )
+        row = write_returning(db, stmt, 404, "Car not found")
+        return fast_json(maintenance_row(row))
 
     @app.put("/maintenances/{maintenance_id}", response_model=MaintenanceResponse)
     def update_maintenance(maintenance_id: int, maintenance: MaintenanceCreate, db: Session = Depends(get_db)):
-        db_maintenance = db.query(Maintenance).filter(Maintenance.id == maintenance_id).first()
-        if not db_maintenance:
-            raise HTTPException(status_code=404, detail="Maintenance not found")
-        db_maintenance.car_id = maintenance.car_id
-        db_maintenance.description = maintenance.description
-        db_maintenance.date = date.fromisoformat(maintenance.date)
-        db_maintenance.cost = maintenance.cost
-        db.commit()
-        db.refresh(db_maintenance)
-        # Возвращаем полный объект
-        full_maintenance = db.query(Maintenance).options(joinedload(Maintenance.car)).filter(Maintenance.id == db_maintenance.id).first()
-        return MaintenanceResponse(
-            id=full_maintenance.id,
-            car=CarResponse(
-                id=full_maintenance.car.id,
-                brand=full_maintenance.car.brand,
-                model=full_maintenance.car.model,
-                year=full_maintenance.car.year,
-                color=full_maintenance.car.color,
-                license_plate=full_maintenance.car.plate,
-                price=full_maintenance.car.price
-            ),
-            description=full_maintenance.description,
-            date=str(full_maintenance.date),
-            cost=full_maintenance.cost
+        stmt = written_maintenance_select(
+            update(Maintenance).where(Maintenance.id == maintenance_id).values(
+                car_id=maintenance.car_id,
+                description=maintenance.description,
+                date=date.fromisoformat(maintenance.date),
+                cost=maintenance.cost,
+            )
         )
+        row = write_returning(db, stmt, 404, "Car not found")
+        if row is None:
+            raise HTTPException(status_code=404, detail="Maintenance not found")
+        return fast_json(maintenance_row(row))
 
     @app.delete("/maintenances/{maintenance_id}")
     def delete_maintenance(maintenance_id: int, db: Session = Depends(get_db)):
-        db_maintenance = db.query(Maintenance).filter(Maintenance.id == maintenance_id).first()
-        if not db_maintenance:
-            raise HTTPException(status_code=404, detail="Maintenance not found")
-        db.delete(db_maintenance)
-        db.commit()
+        delete_returning(db, Maintenance, maintenance_id, "Maintenance")
         return {"message": "Maintenance deleted"}
 
 # Эндпоинты для клиентов
 def setup_client_endpoints(app):
-    @app.get("/clients", response_model=List[ClientResponse])
-    def get_clients(db: Session = Depends(get_db)):
-        clients = db.query(Client).all()
-        return [
-            ClientResponse(
-                id=c.id,
-                full_name=c.full_name,
-                phone=c.phone,
-                license_number=c.license_number,
-                birth_date=str(c.birth_date) if c.birth_date else None
-            ) for c in clients
-        ]
+    @app.get("/clients", response_model=List[ClientResponse], dependencies=[etag_for("clients")])
+    async def get_clients(
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+        after: Optional[int] = Query(None, ge=0),
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        rows = await paginate(db, flat_select(CLIENT_FIELDS), Client.id, response, limit, after)
+        return fast_json([flat_row(r) for r in rows], response)
+
+    @app.get("/clients/search", response_model=List[ClientResponse])
+    async def search_clients(
+        q: str = Query(..., min_length=1),
+        limit: int = Query(20, ge=1, le=MAX_SEARCH_LIMIT),
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        stmt = search_select(CLIENT_FIELDS, [Client.full_name, Client.phone, Client.license_number], q, limit)
+        rows = (await db.execute(stmt)).all()
+        return fast_json([flat_row(r) for r in rows])
+
+    @app.post("/clients/bulk", response_model=List[BulkItemResult])
+    def create_clients_bulk(clients: List[ClientCreate], db: Session = Depends(get_db)):
+        check_bulk_size(clients)
+        # Проверка уникальности номеров прав одним запросом
+        numbers = {c.license_number for c in clients}
+        taken = set(db.execute(select(Client.license_number).where(Client.license_number.in_(numbers))).scalars())
+        results, rows = [], []
+        for i, client in enumerate(clients):
+            if client.license_number in taken:
+                results.append(BulkItemResult(index=i, error="Client with this license number already exists"))
+                continue
+            try:
+                birth_date = date.fromisoformat(client.birth_date)
+            except ValueError:
+                results.append(BulkItemResult(index=i, error="Invalid birth date"))
+                continue
+            taken.add(client.license_number)
+            rows.append({**client.dict(), "birth_date": birth_date})
+            results.append(BulkItemResult(index=i))
+        return bulk_insert(db, Client, rows, results, "Client with this license number already exists")
 
     @app.post("/clients", response_model=ClientResponse)
     def create_client(client: ClientCreate, db: Session = Depends(get_db)):
-        existing = db.query(Client).filter(Client.license_number == client.license_number).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Client with this license number already exists")
-        db_client = Client(**client.dict())
-        db_client.birth_date = date.fromisoformat(client.birth_date)
-        db.add(db_client)
-        db.commit()
-        db.refresh(db_client)
-        return ClientResponse(
-            id=db_client.id,
-            full_name=db_client.full_name,
-            phone=db_client.phone,
-            license_number=db_client.license_number,
-            birth_date=str(db_client.birth_date) if db_client.birth_date else None
+        values = {
+            "full_name": client.full_name,
+            "phone": client.phone,
+            "license_number": client.license_number,
+            "birth_date": date.fromisoformat(client.birth_date),
+        }
+        row = insert_unique(
+            db, Client, values, Client.license_number, CLIENT_FIELDS,
+            "Client with this license number already exists",
         )
+        return fast_json(flat_row(row))
 
     @app.put("/clients/{client_id}", response_model=ClientResponse)
     def update_client(client_id: int, client: ClientCreate, db: Session = Depends(get_db)):
-        db_client = db.query(Client).filter(Client.id == client_id).first()
-        if not db_client:
+        stmt = update(Client).where(Client.id == client_id).values(
+            full_name=client.full_name,
+            phone=client.phone,
+            license_number=client.license_number,
+            birth_date=date.fromisoformat(client.birth_date),
+        ).returning(*columns(CLIENT_FIELDS))
+        row = write_returning(db, stmt, 400, "Client with this license number already exists")
+        if row is None:
             raise HTTPException(status_code=404, detail="Client not found")
-        db_client.full_name = client.full_name
-        db_client.phone = client.phone
-        db_client.license_number = client.license_number
-        db_client.birth_date = date.fromisoformat(client.birth_date)
-        db.commit()
-        db.refresh(db_client)
-        return ClientResponse(
-            id=db_client.id,
-            full_name=db_client.full_name,
-            phone=db_client.phone,
-            license_number=db_client.license_number,
-            birth_date=str(db_client.birth_date) if db_client.birth_date else None
-        )
+        return fast_json(flat_row(row))
 
     @app.delete("/clients/{client_id}")
     def delete_client(client_id: int, db: Session = Depends(get_db)):
-        db_client = db.query(Client).filter(Client.id == client_id).first()
-        if not db_client:
-            raise HTTPException(status_code=404, detail="Client not found")
-        db.delete(db_client)
-        db.commit()
+        delete_returning(db, Client, client_id, "Client")
+        cache.discard(("clients", client_id))
         return {"message": "Client deleted"}
 
 # Эндпоинты для автомобилей
 def setup_car_endpoints(app):
-    @app.get("/cars", response_model=List[CarResponse])
-    def get_cars(db: Session = Depends(get_db)):
-        cars = db.query(Car).all()
-        return [
-            CarResponse(
-                id=c.id,
-                brand=c.brand,
-                model=c.model,
-                year=c.year,
-                color=c.color,
-                license_plate=c.plate,
-                price=c.price
-            ) for c in cars
-        ]
+    @app.get("/cars", response_model=List[CarResponse], dependencies=[etag_for("cars", "brands", "models")])
+    async def get_cars(
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+        after: Optional[int] = Query(None, ge=0),
+        brand: Optional[str] = None,
+        model: Optional[str] = None,
+        brand_id: Optional[int] = None,
+        model_id: Optional[int] = None,
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        stmt = cars_select()
+        if brand is not None:
+            stmt = stmt.filter(Brand.name == brand)
+        if model is not None:
+            stmt = stmt.filter(Model.name == model)
+        if brand_id is not None:
+            stmt = stmt.filter(Car.brand_id == brand_id)
+        if model_id is not None:
+            stmt = stmt.filter(Car.model_id == model_id)
+        rows = await paginate(db, stmt, Car.id, response, limit, after)
+        return fast_json([flat_row(r) for r in rows], response)
+
+    @app.get("/available-cars", response_model=List[CarResponse], dependencies=[etag_for("cars", "brands", "models", "contracts", daily=True)])
+    async def get_available_cars(
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        # Без параметров — автомобили, свободные сегодня
+        start = start or date.today()
+        end = end or start
+        if end < start:
+            raise HTTPException(status_code=400, detail="End date must not be before start date")
+        rows = (await db.execute(available_cars_select(start, end))).all()
+        return fast_json([flat_row(r) for r in rows])
+
+    @app.get("/cars/search", response_model=List[CarResponse])
+    async def search_cars(
+        q: str = Query(..., min_length=1),
+        limit: int = Query(20, ge=1, le=MAX_SEARCH_LIMIT),
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        rows = (await db.execute(join_car_names(search_select(CAR_FIELDS, [Car.plate], q, limit).select_from(Car)))).all()
+        return fast_json([flat_row(r) for r in rows])
+
+    @app.post("/cars/bulk", response_model=List[BulkItemResult])
+    def create_cars_bulk(cars: List[CarCreate], db: Session = Depends(get_db)):
+        check_bulk_size(cars)
+
+        def write():
+            # Проверка уникальности номеров одним запросом
+            plates = {c.plate for c in cars}
+            taken = set(db.execute(select(Car.plate).where(Car.plate.in_(plates))).scalars())
+            brand_ids, model_ids, created = resolve_car_references(db, cars)
+            results, rows = [], []
+            for i, car in enumerate(cars):
+                if car.plate in taken:
+                    results.append(BulkItemResult(index=i, error="Car with this plate already exists"))
+                    continue
+                taken.add(car.plate)
+                rows.append(car_values(car, brand_ids, model_ids))
+                results.append(BulkItemResult(index=i))
+            results = bulk_insert(db, Car, rows, results, "Car with this plate already exists")
+            for table in created:
+                cache.invalidate(table)
+            return results
+
+        return retry_stale_references(write)
 
     @app.post("/cars", response_model=CarResponse)
     def create_car(car: CarCreate, db: Session = Depends(get_db)):
-        existing = db.query(Car).filter(Car.plate == car.plate).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Car with this plate already exists")
-        db_car = Car(**car.dict())
-        db.add(db_car)
-        db.commit()
-        db.refresh(db_car)
-        return CarResponse(
-            id=db_car.id,
-            brand=db_car.brand,
-            model=db_car.model,
-            year=db_car.year,
-            color=db_car.color,
-            license_plate=db_car.plate,
-            price=db_car.price
-        )
+        def write():
+            brand_ids, model_ids, created = resolve_car_references(db, [car])
+            row = insert_unique(
+                db, Car, car_values(car, brand_ids, model_ids), Car.plate, CAR_FIELDS,
+                "Car with this plate already exists", written_select=written_car_select,
+            )
+            for table in created:
+                cache.invalidate(table)
+            return row
+
+        return fast_json(flat_row(retry_stale_references(write)))
 
     @app.put("/cars/{car_id}", response_model=CarResponse)
     def update_car(car_id: int, car: CarUpdate, db: Session = Depends(get_db)):
-        db_car = db.query(Car).filter(Car.id == car_id).first()
-        if not db_car:
+        stmt = written_car_select(update(Car).where(Car.id == car_id).values(
+            color=car.color,
+            plate=car.plate,
+            price=car.price,
+        ))
+        row = write_returning(db, stmt, 400, "Car with this plate already exists")
+        if row is None:
             raise HTTPException(status_code=404, detail="Car not found")
-        db_car.color = car.color
-        db_car.plate = car.plate
-        db_car.price = car.price
-        db.commit()
-        db.refresh(db_car)
-        return CarResponse(
-            id=db_car.id,
-            brand=db_car.brand,
-            model=db_car.model,
-            year=db_car.year,
-            color=db_car.color,
-            license_plate=db_car.plate,
-            price=db_car.price
-        )
+        return fast_json(flat_row(row))
 
     @app.delete("/cars/{car_id}")
     def delete_car(car_id: int, db: Session = Depends(get_db)):
-        db_car = db.query(Car).filter(Car.id == car_id).first()
-        if not db_car:
-            raise HTTPException(status_code=404, detail="Car not found")
-        db.delete(db_car)
-        db.commit()
+        delete_returning(db, Car, car_id, "Car")
+        cache.discard(("cars", car_id))
         return {"message": "Car deleted"}
 
 # Эндпоинты для договоров
 def setup_contract_endpoints(app):
-    @app.get("/contracts", response_model=List[ContractResponse])
-    def get_contracts(db: Session = Depends(get_db)):
-        contracts = db.query(Contract).options(joinedload(Contract.client), joinedload(Contract.car)).all()
-        return [
-            ContractResponse(
-                id=c.id,
-                client=ClientResponse(
-                    id=c.client.id,
-                    full_name=c.client.full_name,
-                    phone=c.client.phone,
-                    license_number=c.client.license_number,
-                    birth_date=str(c.client.birth_date) if c.client.birth_date else None
-                ),
-                car=CarResponse(
-                    id=c.car.id,
-                    brand=c.car.brand,
-                    model=c.car.model,
-                    year=c.car.year,
-                    color=c.car.color,
-                    license_plate=c.car.plate,
-                    price=c.car.price
-                ),
-                start_date=str(c.start_date),
-                end_date=str(c.end_date),
-                payment_date=str(c.payment_date),
-                amount=c.amount,
-                status=c.status
-            ) for c in contracts
-        ]
+    @app.get("/contracts", response_model=List[ContractResponse], dependencies=[etag_for("contracts", "clients", "cars", "brands", "models")])
+    async def get_contracts(
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+        after: Optional[int] = Query(None, ge=0),
+        status: Optional[str] = None,
+        client_id: Optional[int] = None,
+        car_id: Optional[int] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        stmt = contracts_select()
+        if status is not None:
+            stmt = stmt.filter(Contract.status == status)
+        if client_id is not None:
+            stmt = stmt.filter(Contract.client_id == client_id)
+        if car_id is not None:
+            stmt = stmt.filter(Contract.car_id == car_id)
+        # Договоры, период которых пересекается с [date_from, date_to]
+        if date_from is not None:
+            stmt = stmt.filter(Contract.end_date >= date_from)
+        if date_to is not None:
+            stmt = stmt.filter(Contract.start_date <= date_to)
+        rows = await paginate(db, stmt, Contract.id, response, limit, after)
+        return fast_json([contract_row(r) for r in rows], response)
+
+    @app.get("/contracts/export")
+    def export_contracts(fmt: ExportFormat = Query("ndjson", alias="format")):
+        return stream_export(
+            contracts_select().order_by(Contract.id),
+            contract_row, fmt, "contracts",
+        )
 
     @app.post("/contracts", response_model=ContractResponse)
     def create_contract(contract: ContractCreate, db: Session = Depends(get_db)):
-        client = db.query(Client).filter(Client.id == contract.client_id).first()
-        car = db.query(Car).filter(Car.id == contract.car_id).first()
-        if not client or not car:
+        if not record_exists(db, Client, contract.client_id) or not record_exists(db, Car, contract.car_id):
             raise HTTPException(status_code=404, detail="Client or Car not found")
-        db_contract = Contract(**contract.dict())
-        db_contract.start_date = date.fromisoformat(contract.start_date)
-        db_contract.end_date = date.fromisoformat(contract.end_date)
-        db_contract.payment_date = date.fromisoformat(contract.payment_date)
-        db.add(db_contract)
-        db.commit()
-        db.refresh(db_contract)
-        # Возвращаем полный объект
-        full_contract = db.query(Contract).options(joinedload(Contract.client), joinedload(Contract.car)).filter(Contract.id == db_contract.id).first()
-        return ContractResponse(
-            id=full_contract.id,
-            client=ClientResponse(
-                id=full_contract.client.id,
-                full_name=full_contract.client.full_name,
-                phone=full_contract.client.phone,
-                license_number=full_contract.client.license_number,
-                birth_date=str(full_contract.client.birth_date) if full_contract.client.birth_date else None
-            ),
-            car=CarResponse(
-                id=full_contract.car.id,
-                brand=full_contract.car.brand,
-                model=full_contract.car.model,
-                year=full_contract.car.year,
-                color=full_contract.car.color,
-                license_plate=full_contract.car.plate,
-                price=full_contract.car.price
-            ),
-            start_date=str(full_contract.start_date),
-            end_date=str(full_contract.end_date),
-            payment_date=str(full_contract.payment_date),
-            amount=full_contract.amount,
-            status=full_contract.status
-        )
+        stmt = written_contract_select(insert(Contract).values(**contract_values(contract)))
+        row = write_returning(db, stmt, 404, "Client or Car not found")
+        return fast_json(contract_row(row))
 
     @app.put("/contracts/{contract_id}", response_model=ContractResponse)
     def update_contract(contract_id: int, contract: ContractCreate, db: Session = Depends(get_db)):
-        db_contract = db.query(Contract).filter(Contract.id == contract_id).first()
-        if not db_contract:
-            raise HTTPException(status_code=404, detail="Contract not found")
-        client = db.query(Client).filter(Client.id == contract.client_id).first()
-        car = db.query(Car).filter(Car.id == contract.car_id).first()
-        if not client or not car:
+        if not record_exists(db, Client, contract.client_id) or not record_exists(db, Car, contract.car_id):
             raise HTTPException(status_code=404, detail="Client or Car not found")
-        db_contract.client_id = contract.client_id
-        db_contract.car_id = contract.car_id
-        db_contract.start_date = date.fromisoformat(contract.start_date)
-        db_contract.end_date = date.fromisoformat(contract.end_date)
-        db_contract.payment_date = date.fromisoformat(contract.payment_date)
-        db_contract.amount = contract.amount
-        db.commit()
-        db.refresh(db_contract)
-        # Возвращаем полный объект
-        full_contract = db.query(Contract).options(joinedload(Contract.client), joinedload(Contract.car)).filter(Contract.id == db_contract.id).first()
-        return ContractResponse(
-            id=full_contract.id,
-            client=ClientResponse(
-                id=full_contract.client.id,
-                full_name=full_contract.client.full_name,
-                phone=full_contract.client.phone,
-                license_number=full_contract.client.license_number,
-                birth_date=str(full_contract.client.birth_date) if full_contract.client.birth_date else None
-            ),
-            car=CarResponse(
-                id=full_contract.car.id,
-                brand=full_contract.car.brand,
-                model=full_contract.car.model,
-                year=full_contract.car.year,
-                color=full_contract.car.color,
-                license_plate=full_contract.car.plate,
-                price=full_contract.car.price
-            ),
-            start_date=str(full_contract.start_date),
-            end_date=str(full_contract.end_date),
-            payment_date=str(full_contract.payment_date),
-            amount=full_contract.amount,
-            status=full_contract.status
+        stmt = written_contract_select(
+            update(Contract).where(Contract.id == contract_id).values(**contract_values(contract))
         )
+        row = write_returning(db, stmt, 404, "Client or Car not found")
+        if row is None:
+            raise HTTPException(status_code=404, detail="Contract not found")
+        return fast_json(contract_row(row))
+
+    @app.put("/contracts/{contract_id}/complete", response_model=ContractResponse)
+    async def complete_contract(contract_id: int, db: AsyncSession = Depends(get_async_db)):
+        # Один условный UPDATE ... RETURNING в CTE: смена статуса и данные для
+        # ответа без предварительного чтения договора
+        stmt = written_contract_select(
+            update(Contract)
+            .where(Contract.id == contract_id, Contract.status == "active")
+            .values(status="completed")
+        )
+        row = (await db.execute(stmt)).first()
+        await db.commit()
+        if row is None:
+            exists = (await db.execute(select(Contract.id).where(Contract.id == contract_id))).first()
+            if exists is None:
+                raise HTTPException(status_code=404, detail="Contract not found")
+            raise HTTPException(status_code=409, detail="Contract is not active")
+        return fast_json(contract_row(row))
 
     @app.delete("/contracts/{contract_id}")
     def delete_contract(contract_id: int, db: Session = Depends(get_db)):
-        db_contract = db.query(Contract).filter(Contract.id == contract_id).first()
-        if not db_contract:
-            raise HTTPException(status_code=404, detail="Contract not found")
-        db.delete(db_contract)
-        db.commit()
+        delete_returning(db, Contract, contract_id, "Contract")
+        cache.discard(("contracts", contract_id))
         return {"message": "Contract deleted"}
+
+# Средняя величина или None, если делить не на что
+def average(total, count):
+    return total / count if count else None
+
+# Эндпоинты аналитики: читают только сводные таблицы revenue_by_month и
+# revenue_by_car, которые триггеры поддерживают в актуальном состоянии
+def setup_analytics_endpoints(app):
+    @app.get("/analytics/revenue/monthly", response_model=List[RevenueMonthResponse], dependencies=[etag_for("contracts", "payments")])
+    async def get_monthly_revenue(
+        response: Response,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        stmt = filter_date_range(select(RevenueByMonth), RevenueByMonth.month, date_from, date_to)
+        months = (await db.execute(stmt.order_by(RevenueByMonth.month))).scalars().all()
+        return fast_json([
+            {
+                "month": m.month,
+                "contracts_count": m.contracts_count,
+                "contracts_amount": m.contracts_amount,
+                "payments_count": m.payments_count,
+                "payments_amount": m.payments_amount,
+                "avg_contract_days": average(m.contract_days, m.contracts_count),
+            } for m in months
+        ], response)
+
+    @app.get("/analytics/revenue/cars", response_model=List[RevenueCarResponse], dependencies=[etag_for("contracts", "payments", "cars", "brands", "models")])
+    async def get_car_revenue(response: Response, db: AsyncSession = Depends(get_async_db)):
+        stmt = (
+            join_car_names(
+                select(RevenueByCar, *columns(CAR_FIELDS, "car_"))
+                .join(Car, Car.id == RevenueByCar.car_id)
+            )
+            .order_by(RevenueByCar.car_id)
+        )
+        result = []
+        for row in (await db.execute(stmt)).all():
+            r = row[0]
+            result.append({
+                "car": {name: row._mapping["car_" + name] for name in CAR_FIELDS},
+                "contracts_count": r.contracts_count,
+                "contracts_amount": r.contracts_amount,
+                "payments_count": r.payments_count,
+                "payments_amount": r.payments_amount,
+                "avg_contract_days": average(r.contract_days, r.contracts_count),
+            })
+        return fast_json(result, response)
+
+    @app.get("/analytics/contracts/summary", response_model=ContractSummaryResponse, dependencies=[etag_for("contracts", "payments")])
+    async def get_contract_summary(response: Response, db: AsyncSession = Depends(get_async_db)):
+        # Итоги по всем договорам — сумма по автомобилям, O(число автомобилей)
+        totals = (await db.execute(select(
+            func.coalesce(func.sum(RevenueByCar.contracts_count), 0),
+            func.coalesce(func.sum(RevenueByCar.contracts_amount), 0),
+            func.coalesce(func.sum(RevenueByCar.contract_days), 0),
+            func.coalesce(func.sum(RevenueByCar.payments_count), 0),
+            func.coalesce(func.sum(RevenueByCar.payments_amount), 0),
+        ))).one()
+        # sum() по bigint возвращает numeric (Decimal): приводим до арифметики
+        contracts_count, contract_days, payments_count = int(totals[0]), int(totals[2]), int(totals[3])
+        contracts_amount, payments_amount = float(totals[1]), float(totals[4])
+        return fast_json({
+            "contracts_count": contracts_count,
+            "contracts_amount": contracts_amount,
+            "payments_count": payments_count,
+            "payments_amount": payments_amount,
+            "avg_contract_days": average(contract_days, contracts_count),
+            "avg_contract_amount": average(contracts_amount, contracts_count),
+        }, response)
+
+    @app.get("/analytics/maintenance/cars", response_model=List[MaintenanceCarSummaryResponse], dependencies=[etag_for("maintenances", "cars", "brands", "models")])
+    async def get_maintenance_by_car(response: Response, db: AsyncSession = Depends(get_async_db)):
+        stmt = (
+            join_car_names(
+                select(MaintenanceByCar, *columns(CAR_FIELDS, "car_"))
+                .join(Car, Car.id == MaintenanceByCar.car_id)
+            )
+            .order_by(MaintenanceByCar.car_id)
+        )
+        result = []
+        for row in (await db.execute(stmt)).all():
+            m = row[0]
+            result.append({
+                "car": {name: row._mapping["car_" + name] for name in CAR_FIELDS},
+                "services_count": m.services_count,
+                "total_cost": m.total_cost,
+                "last_date": m.last_date,
+            })
+        return fast_json(result, response)
+
+    @app.get("/analytics/maintenance/monthly", response_model=List[MaintenanceMonthSummaryResponse], dependencies=[etag_for("maintenances")])
+    async def get_maintenance_by_month(
+        response: Response,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        stmt = filter_date_range(select(MaintenanceByMonth), MaintenanceByMonth.month, date_from, date_to)
+        months = (await db.execute(stmt.order_by(MaintenanceByMonth.month))).scalars().all()
+        return fast_json([
+            {"month": m.month, "services_count": m.services_count, "total_cost": m.total_cost}
+            for m in months
+        ], response)
+
+    @app.get("/analytics/utilization", dependencies=[etag_for("contracts", "cars", "brands", "models")])
+    async def get_utilization(
+        response: Response,
+        start: date,
+        end: date,
+        include_daily: bool = True,
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        days = (end - start).days + 1
+        if days < 1:
+            raise HTTPException(status_code=400, detail="End date must not be before start date")
+        if days > MAX_UTILIZATION_DAYS:
+            raise HTTPException(status_code=400, detail=f"Window is too long, max {MAX_UTILIZATION_DAYS} days")
+        car_ids, contract_cars, starts, ends = await load_intervals(db, start, end)
+        # Векторный расчёт выполняется вне цикла событий
+        report = await run_in_threadpool(
+            utilization_report, car_ids, contract_cars, starts, ends, start, days, include_daily
+        )
+        return fast_json(report, response)
+
+# Служебные эндпоинты
+def setup_system_endpoints(app):
+    @app.get("/pool-stats")
+    def get_pool_stats():
+        return pool_status()
+
+    @app.get("/cache-stats")
+    def get_cache_stats():
+        return cache.stats()
+
+    # Метрики в текстовом формате Prometheus
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def get_metrics():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    # Последние медленные запросы (новые первыми); with_plans — только с планом EXPLAIN
+    @app.get("/slow-queries")
+    def get_slow_queries(limit: int = Query(50, ge=1, le=1000), with_plans: bool = False):
+        return slow_query_log.entries(limit, with_plans)
@@ -0,0 +1,42 @@
+import hashlib
+from datetime import date
+
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import get_async_db
+from .models import TableVersion
+
+# ETag списка строится из версий таблиц, от которых зависит ответ, и
+# параметров запроса. Версии читаются до выборки данных, поэтому ETag
+# никогда не оказывается новее отданных строк.
+async def table_versions(db: AsyncSession, tables):
+    rows = await db.execute(
+        select(TableVersion.table_name, TableVersion.version).where(TableVersion.table_name.in_(tables))
+    )
+    return dict(rows.all())
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+# Зависимость для списков: при совпадении If-None-Match отвечает 304 ещё
+# до выполнения запроса и сериализации. daily=True для ответов, которые
+# зависят от текущей даты (например, свободные сегодня автомобили).
+def etag_for(*tables, daily: bool = False):
+    async def check_etag(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+        versions = await table_versions(db, tables)
+        # Те же версии использует кэш страниц (cached_list): тело ответа
+        # никогда не оказывается старше ETag, даже если данные изменил
+        # другой процесс
+        request.state.table_versions = versions
+        key = request.url.query + (date.today().isoformat() if daily else "")
+        query = hashlib.sha1(key.encode()).hexdigest()[:12]
+        etag = '"' + ".".join(str(versions.get(t, 0)) for t in tables) + "-" + query + '"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _matches(if_none_match, etag):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+    return Depends(check_etag)
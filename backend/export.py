@@ -0,0 +1,76 @@
+import csv
+import io
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+from .database import SessionLocal
+
+# Сколько строк читать с серверного курсора и отдавать клиенту за раз
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Разворачивает вложенные объекты в плоский словарь для CSV:
+# {"car": {"id": 1}} -> {"car_id": 1}
+def flatten(row, prefix=""):
+    flat = {}
+    for key, value in row.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}_"))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def _ndjson_chunks(rows):
+    lines = []
+    for row in rows:
+        lines.append(orjson.dumps(row).decode())
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+def _csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = None
+    count = 0
+    for row in rows:
+        row = flatten(row)
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row.keys()))
+            writer.writeheader()
+        writer.writerow(row)
+        count += 1
+        if count >= EXPORT_BATCH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+# Потоковая выгрузка: строки читаются с серверного курсора (stream_results)
+# пачками по EXPORT_BATCH_SIZE, поэтому память не зависит от размера таблицы.
+# Сессия открывается внутри генератора, так как ответ отдаётся уже после
+# завершения обработчика.
+def stream_export(stmt, to_dict, fmt: str, filename: str):
+    def rows():
+        db = SessionLocal()
+        try:
+            result = db.execute(stmt, execution_options={"stream_results": True})
+            for row in result.yield_per(EXPORT_BATCH_SIZE):
+                yield to_dict(row)
+        finally:
+            db.close()
+
+    chunks = _csv_chunks(rows()) if fmt == "csv" else _ndjson_chunks(rows())
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
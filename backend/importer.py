@@ -0,0 +1,281 @@
+# Массовая загрузка исторических договоров и платежей из CSV.
+#
+# Файл целиком уходит во временную staging-таблицу через COPY, внешние ключи
+# (клиент по номеру прав, автомобиль по госномеру) разрешаются UPDATE ... FROM
+# по всей таблице сразу, и валидные строки переносятся в рабочую таблицу
+# одним INSERT ... SELECT. Сводки аналитики обновляются после переноса
+# одним агрегатом по staging, а не строковыми триггерами.
+#
+#   python -m backend.importer contracts contracts.csv
+#   python -m backend.importer payments payments.csv
+#
+# Колонки contracts.csv: client_license_number, car_plate, start_date,
+#   end_date, payment_date, amount, status
+# Колонки payments.csv: client_license_number, car_plate, contract_start_date,
+#   date, amount (договор ищется по клиенту, автомобилю и дате начала и
+#   должен быть единственным)
+import argparse
+import csv
+import json
+import time
+from datetime import date
+
+from sqlalchemy import text
+
+from .database import engine
+
+IMPORTS = {
+    "contracts": {
+        "staging": """
+            CREATE TEMP TABLE contracts_staging (
+                line serial,
+                client_license_number text,
+                car_plate text,
+                start_date date,
+                end_date date,
+                payment_date date,
+                amount double precision,
+                status text,
+                client_id integer,
+                car_id integer,
+                rejected text
+            ) ON COMMIT DROP
+        """,
+        "columns": "client_license_number, car_plate, start_date, end_date, payment_date, amount, status",
+        # Каждая строка получает не больше одной причины отклонения, в порядке списка
+        "resolve": [
+            "UPDATE contracts_staging SET status = COALESCE(NULLIF(status, ''), 'active')",
+            """
+            UPDATE contracts_staging s SET client_id = cl.id
+            FROM clients cl WHERE cl.license_number = s.client_license_number
+            """,
+            "UPDATE contracts_staging s SET car_id = c.id FROM cars c WHERE c.plate = s.car_plate",
+            "UPDATE contracts_staging SET rejected = 'unknown_client' WHERE client_id IS NULL",
+            "UPDATE contracts_staging SET rejected = 'unknown_car' WHERE rejected IS NULL AND car_id IS NULL",
+            "UPDATE contracts_staging SET rejected = 'end_before_start' WHERE rejected IS NULL AND end_date < start_date",
+            """
+            UPDATE contracts_staging s SET rejected = 'overlaps_active'
+            WHERE rejected IS NULL AND status = 'active' AND EXISTS (
+                SELECT 1 FROM contracts ct
+                WHERE ct.car_id = s.car_id AND ct.status = 'active'
+                  AND ct.start_date <= s.end_date AND ct.end_date >= s.start_date
+            )
+            """,
+            # Пересекающиеся активные договоры одного автомобиля внутри файла:
+            # какой из них верный, неизвестно, поэтому отклоняются все
+            """
+            UPDATE contracts_staging s SET rejected = 'overlaps_in_file'
+            WHERE rejected IS NULL AND status = 'active' AND EXISTS (
+                SELECT 1 FROM contracts_staging o
+                WHERE o.line <> s.line AND o.rejected IS NULL AND o.status = 'active'
+                  AND o.car_id = s.car_id AND o.start_date <= s.end_date AND o.end_date >= s.start_date
+            )
+            """,
+        ],
+        "reasons": ["unknown_client", "unknown_car", "end_before_start", "overlaps_active", "overlaps_in_file"],
+        "partition_column": None,
+        "merge": """
+            INSERT INTO contracts (client_id, car_id, start_date, end_date, payment_date, amount, status)
+            SELECT client_id, car_id, start_date, end_date, payment_date, amount, status
+            FROM contracts_staging
+            WHERE rejected IS NULL
+            ORDER BY line
+        """,
+        "summaries": [
+            ("revenue_by_car", "car_id", """
+                SELECT car_id, count(*), sum(COALESCE(amount, 0)),
+                       sum(COALESCE(end_date - start_date + 1, 0)), 0, 0
+                FROM contracts_staging WHERE rejected IS NULL
+                GROUP BY car_id
+            """),
+            ("revenue_by_month", "month", """
+                SELECT date_trunc('month', start_date)::date, count(*), sum(COALESCE(amount, 0)),
+                       sum(COALESCE(end_date - start_date + 1, 0)), 0, 0
+                FROM contracts_staging WHERE rejected IS NULL AND start_date IS NOT NULL
+                GROUP BY 1
+            """),
+        ],
+    },
+    "payments": {
+        "staging": """
+            CREATE TEMP TABLE payments_staging (
+                line serial,
+                client_license_number text,
+                car_plate text,
+                contract_start_date date,
+                date date,
+                amount double precision,
+                contract_id integer,
+                matches integer NOT NULL DEFAULT 0,
+                rejected text
+            ) ON COMMIT DROP
+        """,
+        "columns": "client_license_number, car_plate, contract_start_date, date, amount",
+        # Платёж привязывается только к единственному подходящему договору:
+        # при нескольких совпадениях строка отклоняется, а не дублируется
+        "resolve": [
+            """
+            UPDATE payments_staging s SET contract_id = m.contract_id, matches = m.matches
+            FROM (
+                SELECT s.line, min(ct.id) AS contract_id, count(*) AS matches
+                FROM payments_staging s
+                JOIN clients cl ON cl.license_number = s.client_license_number
+                JOIN cars c ON c.plate = s.car_plate
+                JOIN contracts ct ON ct.client_id = cl.id AND ct.car_id = c.id
+                                 AND ct.start_date = s.contract_start_date
+                GROUP BY s.line
+            ) AS m
+            WHERE m.line = s.line
+            """,
+            "UPDATE payments_staging SET rejected = 'unknown_contract' WHERE matches = 0",
+            "UPDATE payments_staging SET rejected = 'ambiguous_contract' WHERE matches > 1",
+            "UPDATE payments_staging SET rejected = 'missing_date' WHERE rejected IS NULL AND date IS NULL",
+        ],
+        "reasons": ["unknown_contract", "ambiguous_contract", "missing_date"],
+        # Секции на все месяцы загружаемой истории, иначе платежи осели бы в payments_default
+        "partition_column": "date",
+        "merge": """
+            INSERT INTO payments (contract_id, date, amount)
+            SELECT contract_id, date, amount
+            FROM payments_staging
+            WHERE rejected IS NULL
+            ORDER BY line
+        """,
+        "summaries": [
+            ("revenue_by_car", "car_id", """
+                SELECT ct.car_id, 0, 0, 0, count(*), sum(COALESCE(s.amount, 0))
+                FROM payments_staging s JOIN contracts ct ON ct.id = s.contract_id
+                WHERE s.rejected IS NULL AND ct.car_id IS NOT NULL
+                GROUP BY ct.car_id
+            """),
+            ("revenue_by_month", "month", """
+                SELECT date_trunc('month', date)::date, 0, 0, 0, count(*), sum(COALESCE(amount, 0))
+                FROM payments_staging WHERE rejected IS NULL
+                GROUP BY 1
+            """),
+        ],
+    },
+}
+
+# Строковые триггеры сводок на время переноса отключаются
+# (app.skip_summaries): при большом файле каждая строка обновляла бы одни и
+# те же строки сводок. Вместо этого приращения считаются по staging одним
+# запросом на сводку; ORDER BY задаёт одинаковый порядок блокировок при
+# параллельных загрузках.
+SUMMARY_COLUMNS = ["contracts_count", "contracts_amount", "contract_days", "payments_count", "payments_amount"]
+
+def summary_delta_sql(table: str, key: str, select: str):
+    updates = ", ".join(f"{column} = r.{column} + EXCLUDED.{column}" for column in SUMMARY_COLUMNS)
+    return f"""
+        INSERT INTO {table} AS r ({key}, {', '.join(SUMMARY_COLUMNS)})
+        {select} ORDER BY 1
+        ON CONFLICT ({key}) DO UPDATE SET {updates}
+    """
+
+# Номера отклонённых строк в отчёте (по каждой причине не больше стольких)
+MAX_REPORTED_ROWS = 20
+
+def check_sql(staging: str, reasons):
+    counts = ", ".join(f"count(*) FILTER (WHERE rejected = '{reason}')" for reason in reasons)
+    return f"SELECT count(*), {counts} FROM {staging}"
+
+def rejected_rows_sql(staging: str):
+    return f"""
+        SELECT rejected, (array_agg(line ORDER BY line))[1:{MAX_REPORTED_ROWS}]
+        FROM {staging} WHERE rejected IS NOT NULL GROUP BY rejected
+    """
+
+# COPY ... FROM STDIN через драйвер движка: psycopg2 (copy_expert) или
+# psycopg 3 (cursor.copy), который SQLAlchemy 2.1 выбирает по умолчанию
+COPY_CHUNK_SIZE = 1 << 20
+
+def copy_from_file(cursor, statement: str, f):
+    if hasattr(cursor, "copy_expert"):
+        cursor.copy_expert(statement, f)
+        return
+    with cursor.copy(statement) as copy:
+        while chunk := f.read(COPY_CHUNK_SIZE):
+            copy.write(chunk)
+
+# Диапазон дат колонки в файле (значения не в формате ISO пропускаются:
+# такие строки отклонит COPY или они попадут в payments_default)
+def file_date_range(path: str, column: str):
+    low = high = None
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            try:
+                value = date.fromisoformat(row[column])
+            except (TypeError, ValueError):
+                continue
+            low = value if low is None else min(low, value)
+            high = value if high is None else max(high, value)
+    return low, high
+
+# Секции на месяцы файла создаются до загрузки отдельной короткой
+# транзакцией: create_payment_partitions присоединяет секции (ATTACH
+# PARTITION) и блокирует payments, а транзакция загрузки длится столько же,
+# сколько COPY и перенос всего файла
+def create_partitions_for_file(path: str, column: str):
+    low, high = file_date_range(path, column)
+    if low is None:
+        return 0
+    with engine.begin() as conn:
+        return conn.execute(text("SELECT create_payment_partitions(:low, :high)"), {"low": low, "high": high}).scalar()
+
+# Загрузка CSV в одной транзакции; при ошибке формата (например, неверная
+# дата) COPY прерывается целиком с номером строки в сообщении Postgres.
+# Ссылки разрешаются и причины отклонения проставляются в staging, в
+# рабочую таблицу переносятся только строки без причины. В отчёте —
+# число отклонённых строк по причинам и их номера (строки данных с 1).
+def import_csv(kind: str, path: str):
+    spec = IMPORTS[kind]
+    staging = f"{kind}_staging"
+    started = time.perf_counter()
+    if spec["partition_column"]:
+        create_partitions_for_file(path, spec["partition_column"])
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(spec["staging"])
+        with open(path, encoding="utf-8") as f:
+            copy_from_file(
+                cursor, f"COPY {staging} ({spec['columns']}) FROM STDIN WITH (FORMAT csv, HEADER true)", f
+            )
+        cursor.execute(f"ANALYZE {staging}")
+        for statement in spec["resolve"]:
+            cursor.execute(statement)
+        cursor.execute(check_sql(staging, spec["reasons"]))
+        staged, *rejected = cursor.fetchone()
+        cursor.execute(rejected_rows_sql(staging))
+        rejected_rows = dict(cursor.fetchall())
+        cursor.execute("SET LOCAL app.skip_summaries = 'on'")
+        cursor.execute(spec["merge"])
+        inserted = cursor.rowcount
+        for table, key, select in spec["summaries"]:
+            cursor.execute(summary_delta_sql(table, key, select))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - started
+    return {
+        "table": kind,
+        "staged": staged,
+        "inserted": inserted,
+        "rejected": dict(zip(spec["reasons"], rejected)),
+        "rejected_rows": rejected_rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(staged / elapsed) if elapsed else staged,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Import historical data from CSV via COPY")
+    parser.add_argument("kind", choices=sorted(IMPORTS))
+    parser.add_argument("path")
+    args = parser.parse_args()
+    print(json.dumps(import_csv(args.kind, args.path)))
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-from .database import engine, metadata
+from .database import engine, async_engine, metadata
+from .migrations import prepare_database
+from .metrics import MetricsMiddleware, instrument_engine
 from .endpoints import (
     setup_brand_endpoints,
     setup_model_endpoints,
@@ -13,6 +15,8 @@ from .endpoints import (
     setup_client_endpoints,
     setup_car_endpoints,
     setup_contract_endpoints,
+    setup_analytics_endpoints,
+    setup_system_endpoints,
 )
 
 # Создание FastAPI-приложения
@@ -28,10 +32,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
-# Создание всех таблиц в базе данных (если они ещё не созданы)
-metadata.create_all(bind=engine)
+# Профилирование: гистограммы времени ответа по маршрутам, время в БД и
+# число SQL-запросов на запрос (отдаются на /metrics)
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+# Создание всех таблиц в базе данных (если они ещё не созданы).
+# Индексы и триггеры для существующей базы: python -m backend.migrations upgrade;
+# без применённых миграций триггеров и ограничений приложение не запустится
+prepare_database(engine, metadata)
 
 # Регистрация всех эндпоинтов
 setup_brand_endpoints(app)
@@ -44,6 +57,8 @@ setup_maintenance_endpoints(app)
 setup_client_endpoints(app)
 setup_car_endpoints(app)
 setup_contract_endpoints(app)
+setup_analytics_endpoints(app)
+setup_system_endpoints(app)
 
 # Корневой эндпоинт для проверки
 @app.get("/")
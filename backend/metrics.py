@@ -0,0 +1,169 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+# Границы корзин гистограмм (как в клиентах Prometheus по умолчанию)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Число SQL-запросов на HTTP-запрос: рост до десятков и сотен — признак N+1
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Запросы, не сопоставленные ни с одним маршрутом (404), собираются под одной
+# меткой, чтобы произвольные пути не раздували число рядов
+UNMATCHED_ROUTE = "<unmatched>"
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            yield bound, total
+
+# Статистика текущего HTTP-запроса: [число SQL-запросов, время в БД].
+# Список изменяемый, поэтому счётчики видны и из потоков threadpool, и из
+# greenlet-ов asyncpg, получивших копию контекста.
+_request_stats: ContextVar = ContextVar("request_stats", default=None)
+# ASGI scope текущего запроса: по нему журнал медленных запросов определяет
+# эндпоинт, из которого выполнен SQL
+_request_scope: ContextVar = ContextVar("request_scope", default=None)
+
+def current_endpoint():
+    scope = _request_scope.get()
+    if scope is None:
+        return None
+    return f'{scope["method"]} {getattr(scope.get("route"), "path", scope["path"])}'
+
+# Метрики процесса по маршрутам: ключ — (метод, шаблон пути)
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.db_time = {}
+        self.statements = {}
+        self.responses = {}
+        self.db_statements_total = 0
+        self.db_seconds_total = 0.0
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, statements: int, db_seconds: float):
+        key = (method, route)
+        with self._lock:
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.db_time[key] = Histogram(LATENCY_BUCKETS)
+                self.statements[key] = Histogram(STATEMENT_BUCKETS)
+            self.latency[key].observe(seconds)
+            self.db_time[key].observe(db_seconds)
+            self.statements[key].observe(statements)
+            response_key = (method, route, status)
+            self.responses[response_key] = self.responses.get(response_key, 0) + 1
+
+    def observe_statement(self, seconds: float):
+        with self._lock:
+            self.db_statements_total += 1
+            self.db_seconds_total += seconds
+
+    # Текстовый формат экспозиции Prometheus
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            _render_histograms(lines, "http_request_duration_seconds",
+                               "HTTP request latency by route", self.latency)
+            _render_histograms(lines, "http_request_db_seconds",
+                               "Time spent in SQL statements per HTTP request", self.db_time)
+            _render_histograms(lines, "http_request_db_statements",
+                               "SQL statements executed per HTTP request", self.statements)
+            lines.append("# HELP http_responses_total HTTP responses by route and status")
+            lines.append("# TYPE http_responses_total counter")
+            for (method, route, status), count in sorted(self.responses.items()):
+                lines.append(f'http_responses_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}')
+            lines.append("# HELP db_statements_total SQL statements executed by the process")
+            lines.append("# TYPE db_statements_total counter")
+            lines.append(f"db_statements_total {self.db_statements_total}")
+            lines.append("# HELP db_statement_seconds_total Time spent in SQL statements by the process")
+            lines.append("# TYPE db_statement_seconds_total counter")
+            lines.append(f"db_statement_seconds_total {self.db_seconds_total}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+def _render_histograms(lines: list, name: str, help_text: str, histograms: dict):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for (method, route), histogram in sorted(histograms.items()):
+        labels = f'method="{method}",route="{_escape(route)}"'
+        for bound, total in histogram.cumulative():
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+metrics = MetricsRegistry()
+
+# Замер каждого SQL-запроса через события движка. Для асинхронного движка
+# подключается его sync_engine.
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        metrics.observe_statement(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+        if started:
+            started.pop()
+
+# ASGI-middleware: время ответа целиком (включая потоковую отдачу), статус
+# и счётчики SQL текущего запроса. Шаблон пути берётся из маршрута, который
+# FastAPI записывает в scope при сопоставлении.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = [0, 0.0]
+        token = _request_stats.set(stats)
+        scope_token = _request_scope.set(scope)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            _request_scope.reset(scope_token)
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            metrics.observe_request(
+                scope["method"], route, status, time.perf_counter() - started, stats[0], stats[1]
+            )
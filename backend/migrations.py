@@ -0,0 +1,431 @@
+# Версионные миграции схемы для уже развёрнутых баз.
+#
+# metadata.create_all создаёт только недостающие таблицы: индексы, триггеры
+# и ограничения на существующих таблицах он не добавляет. Миграции доводят
+# такую базу до состояния моделей из models.py, применённые версии хранятся
+# в schema_migrations.
+#
+#   python -m backend.migrations status
+#   python -m backend.migrations upgrade
+#   python -m backend.migrations stamp     # отметить все версии применёнными
+#
+# Индексы строятся CREATE INDEX CONCURRENTLY вне транзакции: запись в
+# таблицу не блокируется. Если построение прервалось, в базе остаётся
+# невалидный индекс — при повторном запуске он удаляется и строится заново.
+# Все шаги идемпотентны, поэтому прерванную миграцию можно просто повторить.
+import argparse
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from .models import (
+    Base, VERSIONED_TABLES, BUMP_TABLE_VERSION, SUMMARY_FUNCTIONS, MAINTENANCE_SUMMARY_FUNCTIONS,
+    CONTRACTS_SUMMARY_TRIGGER, PAYMENTS_SUMMARY_TRIGGER, MAINTENANCES_SUMMARY_TRIGGER,
+    CONTRACT_OVERLAP_CONSTRAINT, CONTRACT_OVERLAP_SQL, PAYMENT_PARTITION_FUNCTIONS, version_trigger_sql,
+    payment_partitions_sql,
+)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_MIGRATIONS = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version integer PRIMARY KEY,
+    name text NOT NULL,
+    applied_at timestamptz NOT NULL DEFAULT now()
+)
+"""
+
+# Индекс строится по определению из моделей, чтобы новая база (create_all)
+# и мигрированная получили одинаковые индексы
+def model_index(name: str):
+    for table in Base.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError(name)
+
+def _index_valid(conn, name: str):
+    return conn.execute(text("""
+        SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = :name
+    """), {"name": name}).scalar()
+
+def _index_unique(conn, name: str):
+    return conn.execute(text("""
+        SELECT i.indisunique FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = :name AND i.indisvalid
+    """), {"name": name}).scalar()
+
+def _build_concurrently(conn, index, name: str):
+    if _index_valid(conn, name) is False:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    sql = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+    sql = sql.replace(" INDEX ", " INDEX CONCURRENTLY ", 1)
+    if name != index.name:
+        sql = sql.replace(f" {index.name} ON ", f" {name} ON ", 1)
+    conn.execute(text(sql))
+
+# Шаг миграции: индекс из моделей, CREATE INDEX CONCURRENTLY
+class ConcurrentIndex:
+    def __init__(self, name: str):
+        self.name = name
+
+    def run(self, engine):
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if _index_valid(conn, self.name):
+                logger.info("index %s already exists", self.name)
+                return
+            logger.info("creating index %s", self.name)
+            _build_concurrently(conn, model_index(self.name), self.name)
+
+# Шаг миграции: обычный индекс по столбцу превращается в уникальный с тем же
+# именем. Уникальный индекс строится рядом под временным именем, затем старый
+# удаляется и новый переименовывается — всё без блокировки записи.
+# При дубликатах построение падает; их нужно устранить и повторить миграцию.
+class UniqueIndex:
+    def __init__(self, name: str):
+        self.name = name
+
+    def run(self, engine):
+        index = model_index(self.name)
+        staging = f"{self.name}_unique"
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if _index_unique(conn, self.name):
+                logger.info("index %s is already unique", self.name)
+                return
+            logger.info("creating unique index %s", self.name)
+            if not _index_valid(conn, staging):
+                _build_concurrently(conn, index, staging)
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {self.name}"))
+            conn.execute(text(f"ALTER INDEX {staging} RENAME TO {self.name}"))
+
+# Шаг миграции: набор команд в одной транзакции. Элементы — строки SQL,
+# объекты DDL или функции, принимающие соединение.
+class Transaction:
+    def __init__(self, *statements):
+        self.statements = statements
+
+    def run(self, engine):
+        with engine.begin() as conn:
+            for statement in self.statements:
+                if callable(statement) and not hasattr(statement, "compile"):
+                    statement(conn)
+                elif isinstance(statement, str):
+                    conn.execute(text(statement))
+                else:
+                    conn.execute(statement)
+
+def create_tables(*names):
+    def run(conn):
+        for name in names:
+            Base.metadata.tables[name].create(conn, checkfirst=True)
+    return run
+
+def replace_trigger(name: str, table: str, create_sql: str):
+    return Transaction(f"DROP TRIGGER IF EXISTS {name} ON {table}", create_sql)
+
+def add_constraint_if_missing(name: str, sql: str):
+    def run(conn):
+        exists = conn.execute(text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": name}).scalar()
+        if not exists:
+            conn.execute(text(sql))
+    return run
+
+def _column_exists(conn, table: str, column: str):
+    return conn.execute(text("""
+        SELECT 1 FROM information_schema.columns WHERE table_name = :table AND column_name = :column
+    """), {"table": table, "column": column}).scalar()
+
+# Перенос строковых марок и моделей автомобилей в справочники: недостающие
+# названия добавляются в brands и models, в cars проставляются их id.
+# После удаления строковых столбцов (повторный запуск) шаг ничего не делает.
+def backfill_car_references(conn):
+    if not _column_exists(conn, "cars", "brand"):
+        return
+    conn.execute(text("""
+        INSERT INTO brands (name) SELECT DISTINCT brand FROM cars WHERE brand IS NOT NULL
+        ON CONFLICT (name) DO NOTHING
+    """))
+    conn.execute(text("""
+        INSERT INTO models (name) SELECT DISTINCT model FROM cars WHERE model IS NOT NULL
+        ON CONFLICT (name) DO NOTHING
+    """))
+    conn.execute(text("UPDATE cars SET brand_id = b.id FROM brands b WHERE b.name = cars.brand AND cars.brand_id IS NULL"))
+    conn.execute(text("UPDATE cars SET model_id = m.id FROM models m WHERE m.name = cars.model AND cars.model_id IS NULL"))
+
+# Перестройка payments в секционированную таблицу. Старая таблица, её индексы
+# и последовательность переименовываются, новая создаётся по модели (вместе
+# с триггерами и секциями), строки копируются без пересчёта сводок, старая
+# таблица удаляется. На время копирования payments недоступна (ACCESS
+# EXCLUSIVE). Платежи без даты нужно исправить заранее: date входит в ключ.
+def partition_payments(conn):
+    partitioned = conn.execute(text(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('payments')"
+    )).scalar()
+    if partitioned:
+        logger.info("payments is already partitioned")
+        return
+    conn.execute(text("LOCK TABLE payments IN ACCESS EXCLUSIVE MODE"))
+    conn.execute(text("ALTER TABLE payments RENAME TO payments_unpartitioned"))
+    indexes = conn.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = 'payments_unpartitioned'"
+    )).scalars().all()
+    for index in indexes:
+        conn.execute(text(f"ALTER INDEX {index} RENAME TO {index[:40]}_unpartitioned"))
+    conn.execute(text("ALTER SEQUENCE payments_id_seq RENAME TO payments_unpartitioned_id_seq"))
+    Base.metadata.tables["payments"].create(conn)
+    conn.execute(text(payment_partitions_sql("(SELECT min(date) FROM payments_unpartitioned)")))
+    conn.execute(text("SET LOCAL app.skip_summaries = 'on'"))
+    conn.execute(text(
+        "INSERT INTO payments (id, contract_id, date, amount) "
+        "SELECT id, contract_id, date, amount FROM payments_unpartitioned"
+    ))
+    conn.execute(text("SET LOCAL app.skip_summaries = 'off'"))
+    conn.execute(text(
+        "SELECT setval(pg_get_serial_sequence('payments', 'id'), COALESCE(max(id), 0) + 1, false) FROM payments"
+    ))
+    conn.execute(text("DROP TABLE payments_unpartitioned"))
+
+# Пересчёт сводок с нуля. Миграция сначала блокирует таблицы-источники от
+# записи до конца транзакции, чтобы между установкой триггеров и пересчётом
+# не потерялись изменения; чтение при этом не блокируется.
+REVENUE_BACKFILL = [
+    "TRUNCATE revenue_by_car, revenue_by_month",
+    """
+    INSERT INTO revenue_by_car (car_id, contracts_count, contracts_amount, contract_days, payments_count, payments_amount)
+    SELECT car_id, count(*), sum(COALESCE(amount, 0)), sum(COALESCE(end_date - start_date + 1, 0)), 0, 0
+    FROM contracts WHERE car_id IS NOT NULL GROUP BY car_id
+    """,
+    """
+    INSERT INTO revenue_by_car AS r (car_id, contracts_count, contracts_amount, contract_days, payments_count, payments_amount)
+    SELECT c.car_id, 0, 0, 0, count(*), sum(COALESCE(p.amount, 0))
+    FROM payments p JOIN contracts c ON c.id = p.contract_id
+    WHERE c.car_id IS NOT NULL GROUP BY c.car_id
+    ON CONFLICT (car_id) DO UPDATE SET
+        payments_count = EXCLUDED.payments_count, payments_amount = EXCLUDED.payments_amount
+    """,
+    """
+    INSERT INTO revenue_by_month (month, contracts_count, contracts_amount, contract_days, payments_count, payments_amount)
+    SELECT date_trunc('month', start_date)::date, count(*), sum(COALESCE(amount, 0)),
+           sum(COALESCE(end_date - start_date + 1, 0)), 0, 0
+    FROM contracts WHERE start_date IS NOT NULL GROUP BY 1
+    """,
+    """
+    INSERT INTO revenue_by_month AS r (month, contracts_count, contracts_amount, contract_days, payments_count, payments_amount)
+    SELECT date_trunc('month', date)::date, 0, 0, 0, count(*), sum(COALESCE(amount, 0))
+    FROM payments WHERE date IS NOT NULL GROUP BY 1
+    ON CONFLICT (month) DO UPDATE SET
+        payments_count = EXCLUDED.payments_count, payments_amount = EXCLUDED.payments_amount
+    """,
+]
+
+MAINTENANCE_BACKFILL = [
+    "TRUNCATE maintenance_by_car, maintenance_by_month",
+    """
+    INSERT INTO maintenance_by_car (car_id, services_count, total_cost, last_date)
+    SELECT car_id, count(*), sum(COALESCE(cost, 0)), max(date)
+    FROM maintenances WHERE car_id IS NOT NULL GROUP BY car_id
+    """,
+    """
+    INSERT INTO maintenance_by_month (month, services_count, total_cost)
+    SELECT date_trunc('month', date)::date, count(*), sum(COALESCE(cost, 0))
+    FROM maintenances WHERE date IS NOT NULL GROUP BY 1
+    """,
+]
+
+# (версия, имя, шаги). Новые миграции добавляются в конец.
+MIGRATIONS = [
+    (1, "foreign_key_and_date_indexes", [
+        ConcurrentIndex("ix_payments_contract_id"),
+        ConcurrentIndex("ix_payments_date"),
+        ConcurrentIndex("ix_insurances_contract_id"),
+        ConcurrentIndex("ix_maintenances_date"),
+        ConcurrentIndex("ix_maintenances_car_date"),
+        ConcurrentIndex("ix_contracts_client_id"),
+        ConcurrentIndex("ix_contracts_start_date"),
+        ConcurrentIndex("ix_contracts_end_date"),
+        ConcurrentIndex("ix_contracts_car_period"),
+    ]),
+    (2, "active_contract_partial_indexes", [
+        ConcurrentIndex("ix_contracts_active_car_period"),
+        ConcurrentIndex("ix_contracts_active"),
+    ]),
+    (3, "trigram_search_indexes", [
+        Transaction("CREATE EXTENSION IF NOT EXISTS pg_trgm"),
+        ConcurrentIndex("ix_clients_full_name_trgm"),
+        ConcurrentIndex("ix_clients_phone_trgm"),
+        ConcurrentIndex("ix_clients_license_number_trgm"),
+        ConcurrentIndex("ix_cars_plate_trgm"),
+    ]),
+    (4, "table_version_triggers", [
+        Transaction(create_tables("table_versions"), BUMP_TABLE_VERSION),
+        *[replace_trigger(f"{table}_version", table, version_trigger_sql(table)) for table in VERSIONED_TABLES],
+    ]),
+    (5, "revenue_summaries", [
+        Transaction(
+            "LOCK TABLE contracts, payments IN SHARE ROW EXCLUSIVE MODE",
+            create_tables("revenue_by_month", "revenue_by_car"),
+            SUMMARY_FUNCTIONS,
+            "DROP TRIGGER IF EXISTS contracts_summary ON contracts",
+            CONTRACTS_SUMMARY_TRIGGER,
+            "DROP TRIGGER IF EXISTS payments_summary ON payments",
+            PAYMENTS_SUMMARY_TRIGGER,
+            *REVENUE_BACKFILL,
+        ),
+    ]),
+    (6, "maintenance_summaries", [
+        Transaction(
+            "LOCK TABLE maintenances IN SHARE ROW EXCLUSIVE MODE",
+            create_tables("maintenance_by_car", "maintenance_by_month"),
+            MAINTENANCE_SUMMARY_FUNCTIONS,
+            "DROP TRIGGER IF EXISTS maintenances_summary ON maintenances",
+            MAINTENANCES_SUMMARY_TRIGGER,
+            *MAINTENANCE_BACKFILL,
+        ),
+    ]),
+    (7, "unique_parking_and_employee_names", [
+        UniqueIndex("ix_parkings_name"),
+        UniqueIndex("ix_employees_full_name"),
+    ]),
+    # Ограничение исключения нельзя построить CONCURRENTLY: ALTER TABLE
+    # держит блокировку contracts на время построения GiST-индекса, поэтому
+    # миграция вынесена отдельно. Пересекающиеся активные договоры нужно
+    # разрешить заранее, иначе построение завершится ошибкой.
+    (8, "contract_overlap_exclusion", [
+        Transaction(
+            "CREATE EXTENSION IF NOT EXISTS btree_gist",
+            add_constraint_if_missing(CONTRACT_OVERLAP_CONSTRAINT, CONTRACT_OVERLAP_SQL),
+        ),
+    ]),
+    # Марка и модель автомобиля становятся ссылками на brands и models.
+    # Внешние ключи добавляются NOT VALID (без проверки существующих строк под
+    # блокировкой) и проверяются отдельной транзакцией после заполнения.
+    # Строковые столбцы удаляются в конце: миграцию нужно применить перед
+    # развёртыванием версии, которая читает brand_id и model_id.
+    (9, "normalize_car_brand_model", [
+        Transaction(
+            "ALTER TABLE cars ADD COLUMN IF NOT EXISTS brand_id integer",
+            "ALTER TABLE cars ADD COLUMN IF NOT EXISTS model_id integer",
+            add_constraint_if_missing(
+                "cars_brand_id_fkey",
+                "ALTER TABLE cars ADD CONSTRAINT cars_brand_id_fkey FOREIGN KEY (brand_id) REFERENCES brands (id) NOT VALID",
+            ),
+            add_constraint_if_missing(
+                "cars_model_id_fkey",
+                "ALTER TABLE cars ADD CONSTRAINT cars_model_id_fkey FOREIGN KEY (model_id) REFERENCES models (id) NOT VALID",
+            ),
+        ),
+        Transaction("LOCK TABLE cars IN SHARE ROW EXCLUSIVE MODE", backfill_car_references),
+        Transaction(
+            "ALTER TABLE cars VALIDATE CONSTRAINT cars_brand_id_fkey",
+            "ALTER TABLE cars VALIDATE CONSTRAINT cars_model_id_fkey",
+        ),
+        ConcurrentIndex("ix_cars_brand_id"),
+        ConcurrentIndex("ix_cars_model_id"),
+        Transaction(
+            "DROP INDEX IF EXISTS ix_cars_brand",
+            "DROP INDEX IF EXISTS ix_cars_model",
+            "ALTER TABLE cars DROP COLUMN IF EXISTS brand",
+            "ALTER TABLE cars DROP COLUMN IF EXISTS model",
+        ),
+    ]),
+    # Триггерные функции сводок получают проверку app.skip_summaries до
+    # перестройки payments и первого переноса в архив
+    (10, "payment_partitions_and_contract_archive", [
+        Transaction(SUMMARY_FUNCTIONS, PAYMENT_PARTITION_FUNCTIONS),
+        Transaction(create_tables("contracts_archive", "payments_archive", "insurances_archive")),
+        Transaction(partition_payments),
+    ]),
+    # create_payment_partitions переносит строки месяца из payments_default
+    # в новую секцию, а не пропускает такой месяц. Уже осевшие там платежи
+    # разносит по секциям очередной запуск backend.archive partitions.
+    (11, "payment_partitions_from_default", [
+        Transaction(PAYMENT_PARTITION_FUNCTIONS),
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Миграции, которые только добавляют индексы: без них приложение отвечает
+# верно, но медленнее. Без остальных ответы неверны (ETag не меняется после
+# записи, сводки отстают, пересечения договоров не проверяются), поэтому
+# приложение с такими неприменёнными миграциями не запускается.
+INDEX_ONLY_MIGRATIONS = {1, 2, 3}
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA_MIGRATIONS))
+        return set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+def _record(engine, version: int, name: str):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO schema_migrations (version, name) VALUES (:version, :name) ON CONFLICT DO NOTHING"
+        ), {"version": version, "name": name})
+
+def pending_migrations(engine):
+    applied = applied_versions(engine)
+    return [(version, name) for version, name, _ in MIGRATIONS if version not in applied]
+
+def upgrade(engine):
+    applied = applied_versions(engine)
+    done = []
+    for version, name, steps in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info("applying migration %s %s", version, name)
+        for step in steps:
+            step.run(engine)
+        _record(engine, version, name)
+        done.append((version, name))
+    return done
+
+def stamp(engine):
+    applied_versions(engine)
+    for version, name, _ in MIGRATIONS:
+        _record(engine, version, name)
+
+# Подготовка базы при запуске приложения. Пустая база создаётся целиком по
+# моделям и сразу получает отметку всех миграций. В существующей создаются
+# только недостающие таблицы, а неприменённые миграции нужно применить
+# командой upgrade (построение индексов на живой базе не должно идти при
+# старте каждого воркера). Неприменённые индексные миграции выводятся в
+# лог, остальные останавливают запуск.
+def prepare_database(engine, metadata):
+    with engine.connect() as conn:
+        fresh = not conn.execute(text("SELECT to_regclass('contracts') IS NOT NULL")).scalar()
+    metadata.create_all(bind=engine)
+    if fresh:
+        stamp(engine)
+        return
+    pending = pending_migrations(engine)
+    if not pending:
+        return
+    names = ", ".join(f"{version}:{name}" for version, name in pending)
+    if any(version not in INDEX_ONLY_MIGRATIONS for version, _ in pending):
+        raise RuntimeError(f"database has pending migrations {names}, run: python -m backend.migrations upgrade")
+    logger.warning("database has pending migrations %s, run: python -m backend.migrations upgrade", names)
+
+def main():
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="Apply schema migrations")
+    parser.add_argument("command", choices=["status", "upgrade", "stamp"])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "status":
+        applied = applied_versions(engine)
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:>4} {'applied' if version in applied else 'pending'} {name}")
+    elif args.command == "upgrade":
+        done = upgrade(engine)
+        print(f"applied {len(done)} migration(s), schema at version {LATEST_VERSION}")
+    else:
+        stamp(engine)
+        print(f"stamped version {LATEST_VERSION}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,21 @@
-from sqlalchemy import Column, Integer, String, Date, Float, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Date, Float, ForeignKey, Index, DDL, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
 Base = declarative_base()
 
+# Расширение pg_trgm нужно для триграммных индексов поиска,
+# btree_gist — для ограничения исключения по car_id (оператор = в GiST)
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+
+# GIN-индекс по триграммам: ускоряет ILIKE '%...%' и поиск по похожести
+def trigram_index(table: str, column: str):
+    return Index(
+        f"ix_{table}_{column}_trgm", column,
+        postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"},
+    )
+
 # Марка автомобиля
 class Brand(Base):
     __tablename__ = "brands"
@@ -20,28 +32,84 @@ class Model(Base):
 class Parking(Base):
     __tablename__ = "parkings"
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
+    name = Column(String, unique=True, index=True)
 
 # Модель для сотрудника
 class Employee(Base):
     __tablename__ = "employees"
     id = Column(Integer, primary_key=True, index=True)
-    full_name = Column(String, index=True)
+    full_name = Column(String, unique=True, index=True)
 
-# Модель для платежа
+# Модель для платежа. Таблица секционирована по месяцам даты платежа
+# (RANGE): запросы с фильтром по дате читают только нужные секции, а индексы
+# каждой секции малы. Ключ секционирования обязан входить в первичный ключ,
+# поэтому он составной (id, date) и индексирует id.
 class Payment(Base):
     __tablename__ = "payments"
-    id = Column(Integer, primary_key=True, index=True)
-    contract_id = Column(Integer, ForeignKey("contracts.id"))
-    date = Column(Date)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    contract_id = Column(Integer, ForeignKey("contracts.id"), index=True)
+    date = Column(Date, primary_key=True, index=True)
     amount = Column(Float)
     contract = relationship("Contract", back_populates="payments")
+    __table_args__ = {"postgresql_partition_by": "RANGE (date)"}
+
+# Секции платежей payments_pYYYY_MM создаются заранее (python -m
+# backend.archive partitions). Платежи вне созданных секций попадают в
+# payments_default; при создании секции месяца его строки переносятся из
+# payments_default в неё (секция создаётся отдельной таблицей и
+# присоединяется ATTACH PARTITION после переноса). Сводки при переносе не
+# меняются: строки остаются теми же платежами.
+PAYMENT_PARTITION_FUNCTIONS = DDL("""
+CREATE OR REPLACE FUNCTION create_payment_partitions(p_from date, p_to date) RETURNS integer AS $$
+DECLARE
+    v_month date := date_trunc('month', p_from)::date;
+    v_next date;
+    v_name text;
+    v_skip_summaries text := COALESCE(current_setting('app.skip_summaries', true), 'off');
+    v_created integer := 0;
+BEGIN
+    WHILE v_month <= p_to LOOP
+        v_next := (v_month + interval '1 month')::date;
+        v_name := 'payments_p' || to_char(v_month, 'YYYY_MM');
+        IF to_regclass(v_name) IS NULL THEN
+            EXECUTE 'CREATE TABLE ' || quote_ident(v_name) || ' (LIKE payments INCLUDING DEFAULTS)';
+            PERFORM set_config('app.skip_summaries', 'on', true);
+            EXECUTE 'WITH moved AS (DELETE FROM payments_default WHERE date >= $1 AND date < $2 '
+                || 'RETURNING id, contract_id, date, amount) INSERT INTO ' || quote_ident(v_name)
+                || ' (id, contract_id, date, amount) SELECT id, contract_id, date, amount FROM moved'
+                USING v_month, v_next;
+            PERFORM set_config('app.skip_summaries', v_skip_summaries, true);
+            EXECUTE 'ALTER TABLE payments ATTACH PARTITION ' || quote_ident(v_name) || ' FOR VALUES FROM ('
+                || quote_literal(v_month) || ') TO (' || quote_literal(v_next) || ')';
+            v_created := v_created + 1;
+        END IF;
+        v_month := v_next;
+    END LOOP;
+    RETURN v_created;
+END
+$$ LANGUAGE plpgsql
+""")
+
+# Сколько месяцев вперёд создаются секции платежей
+PAYMENT_PARTITION_MONTHS_AHEAD = 12
+
+PAYMENT_DEFAULT_PARTITION_SQL = "CREATE TABLE payments_default PARTITION OF payments DEFAULT"
+
+def payment_partitions_sql(start: str, months_ahead: int = PAYMENT_PARTITION_MONTHS_AHEAD):
+    return (
+        f"SELECT create_payment_partitions({start}, "
+        f"(date_trunc('month', CURRENT_DATE) + interval '{months_ahead} months')::date)"
+    )
+
+event.listen(Base.metadata, "before_create", PAYMENT_PARTITION_FUNCTIONS)
+event.listen(Payment.__table__, "after_create", DDL(PAYMENT_DEFAULT_PARTITION_SQL))
+event.listen(Payment.__table__, "after_create", DDL(payment_partitions_sql("CURRENT_DATE")))
 
 # Модель для страховки
 class Insurance(Base):
     __tablename__ = "insurances"
     id = Column(Integer, primary_key=True, index=True)
-    contract_id = Column(Integer, ForeignKey("contracts.id"))
+    contract_id = Column(Integer, ForeignKey("contracts.id"), index=True)
     cost = Column(Float)
     contract = relationship("Contract", back_populates="insurances")
 
@@ -51,9 +119,13 @@ class Maintenance(Base):
     id = Column(Integer, primary_key=True, index=True)
     car_id = Column(Integer, ForeignKey('cars.id'))
     description = Column(String)
-    date = Column(Date)
+    date = Column(Date, index=True)
     cost = Column(Float)
     car = relationship("Car", back_populates="maintenances")
+    # Выборки по автомобилю и поиск последней даты обслуживания
+    __table_args__ = (
+        Index("ix_maintenances_car_date", "car_id", "date"),
+    )
 
 # Модель для клиента
 class Client(Base):
@@ -64,32 +136,321 @@ class Client(Base):
     license_number = Column(String, unique=True, index=True)
     birth_date = Column(Date)
     contracts = relationship("Contract", back_populates="client")
+    __table_args__ = (
+        trigram_index("clients", "full_name"),
+        trigram_index("clients", "phone"),
+        trigram_index("clients", "license_number"),
+    )
 
 # Модель для автомобиля
 class Car(Base):
     __tablename__ = "cars"
     id = Column(Integer, primary_key=True, index=True)
-    brand = Column(String, index=True)
-    model = Column(String, index=True)
+    # Марка и модель — ссылки на справочники brands и models
+    brand_id = Column(Integer, ForeignKey("brands.id"), index=True)
+    model_id = Column(Integer, ForeignKey("models.id"), index=True)
     year = Column(Integer)
     color = Column(String)
     plate = Column(String, unique=True, index=True)
     price = Column(Float)
+    brand = relationship("Brand")
+    model = relationship("Model")
     maintenances = relationship("Maintenance", back_populates="car")
     contracts = relationship("Contract", back_populates="car")
+    __table_args__ = (
+        trigram_index("cars", "plate"),
+    )
 
 # Модель для договора
 class Contract(Base):
     __tablename__ = "contracts"
     id = Column(Integer, primary_key=True, index=True)
-    client_id = Column(Integer, ForeignKey("clients.id"))
+    client_id = Column(Integer, ForeignKey("clients.id"), index=True)
     car_id = Column(Integer, ForeignKey("cars.id"))
-    start_date = Column(Date)
-    end_date = Column(Date)
+    start_date = Column(Date, index=True)
+    end_date = Column(Date, index=True)
     payment_date = Column(Date)
     amount = Column(Float)
     status = Column(String, default="active")
     client = relationship("Client", back_populates="contracts")
-    car = relationship("Car", back_populates="car")
+    car = relationship("Car", back_populates="contracts")
     payments = relationship("Payment", back_populates="contract")
     insurances = relationship("Insurance", back_populates="contract")
+    # Составной индекс для поиска пересекающихся договоров по автомобилю
+    # (покрывает и выборки по одному car_id). Частичные индексы по активным
+    # договорам содержат только «живые» строки: проверка доступности и
+    # список активных договоров не затрагивают историю.
+    __table_args__ = (
+        Index("ix_contracts_car_period", "car_id", "start_date", "end_date"),
+        Index(
+            "ix_contracts_active_car_period", "car_id", "start_date", "end_date",
+            postgresql_where=status == "active",
+        ),
+        Index("ix_contracts_active", "id", postgresql_where=status == "active"),
+    )
+
+# Защита от двойного бронирования: активные договоры одного автомобиля не
+# могут пересекаться по датам (границы включительно). Проверку выполняет
+# GiST-индекс ограничения, поэтому она корректна при параллельных запросах
+# без блокировок таблицы; нарушение — IntegrityError с кодом 23P01.
+CONTRACT_OVERLAP_CONSTRAINT = "contracts_car_period_excl"
+
+CONTRACT_OVERLAP_SQL = f"""
+ALTER TABLE contracts ADD CONSTRAINT {CONTRACT_OVERLAP_CONSTRAINT}
+EXCLUDE USING gist (car_id WITH =, daterange(start_date, end_date, '[]') WITH &&)
+WHERE (status = 'active')
+"""
+
+event.listen(Contract.__table__, "after_create", DDL(CONTRACT_OVERLAP_SQL))
+
+# Архив завершённых договоров с их платежами и страховками (заполняется
+# командой python -m backend.archive contracts). Рабочие таблицы и их индексы
+# содержат только актуальные данные; столбцы архива совпадают с рабочими.
+class ContractArchive(Base):
+    __tablename__ = "contracts_archive"
+    id = Column(Integer, primary_key=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), index=True)
+    car_id = Column(Integer, ForeignKey("cars.id"), index=True)
+    start_date = Column(Date)
+    end_date = Column(Date, index=True)
+    payment_date = Column(Date)
+    amount = Column(Float)
+    status = Column(String)
+
+class PaymentArchive(Base):
+    __tablename__ = "payments_archive"
+    id = Column(Integer, primary_key=True)
+    contract_id = Column(Integer, ForeignKey("contracts_archive.id"), index=True)
+    date = Column(Date)
+    amount = Column(Float)
+
+class InsuranceArchive(Base):
+    __tablename__ = "insurances_archive"
+    id = Column(Integer, primary_key=True)
+    contract_id = Column(Integer, ForeignKey("contracts_archive.id"), index=True)
+    cost = Column(Float)
+
+# Версии таблиц для ETag: счётчик увеличивается триггером на каждую
+# изменяющую команду, в той же транзакции, что и сами данные
+class TableVersion(Base):
+    __tablename__ = "table_versions"
+    table_name = Column(String, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+VERSIONED_TABLES = [
+    "brands", "models", "parkings", "employees", "payments",
+    "insurances", "maintenances", "clients", "cars", "contracts",
+]
+
+BUMP_TABLE_VERSION = DDL("""
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO table_versions (table_name, version) VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = table_versions.version + 1;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+""")
+
+def version_trigger_sql(table: str):
+    return (
+        f"CREATE TRIGGER {table}_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE "
+        f"ON {table} FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()"
+    )
+
+event.listen(Base.metadata, "before_create", BUMP_TABLE_VERSION)
+for _table in VERSIONED_TABLES:
+    event.listen(Base.metadata.tables[_table], "after_create", DDL(version_trigger_sql(_table)))
+
+# Сводки для аналитики. Обновляются инкрементально строковыми триггерами
+# на contracts и payments (в той же транзакции), поэтому чтение сводки не
+# зависит от объёма истории.
+class RevenueByMonth(Base):
+    __tablename__ = "revenue_by_month"
+    month = Column(Date, primary_key=True)
+    contracts_count = Column(BigInteger, nullable=False, default=0)
+    contracts_amount = Column(Float, nullable=False, default=0)
+    contract_days = Column(BigInteger, nullable=False, default=0)
+    payments_count = Column(BigInteger, nullable=False, default=0)
+    payments_amount = Column(Float, nullable=False, default=0)
+
+class RevenueByCar(Base):
+    __tablename__ = "revenue_by_car"
+    car_id = Column(Integer, primary_key=True)
+    contracts_count = Column(BigInteger, nullable=False, default=0)
+    contracts_amount = Column(Float, nullable=False, default=0)
+    contract_days = Column(BigInteger, nullable=False, default=0)
+    payments_count = Column(BigInteger, nullable=False, default=0)
+    payments_amount = Column(Float, nullable=False, default=0)
+
+SUMMARY_FUNCTIONS = DDL("""
+CREATE OR REPLACE FUNCTION apply_contract_summary(
+    p_car_id integer, p_start date, p_end date, p_amount double precision, p_sign integer
+) RETURNS void AS $$
+DECLARE
+    v_days integer := COALESCE(p_end - p_start + 1, 0);
+    v_amount double precision := p_sign * COALESCE(p_amount, 0);
+BEGIN
+    IF p_car_id IS NOT NULL THEN
+        INSERT INTO revenue_by_car AS r (car_id, contracts_count, contracts_amount, contract_days, payments_count, payments_amount)
+        VALUES (p_car_id, p_sign, v_amount, p_sign * v_days, 0, 0)
+        ON CONFLICT (car_id) DO UPDATE SET
+            contracts_count = r.contracts_count + EXCLUDED.contracts_count,
+            contracts_amount = r.contracts_amount + EXCLUDED.contracts_amount,
+            contract_days = r.contract_days + EXCLUDED.contract_days;
+    END IF;
+    IF p_start IS NOT NULL THEN
+        INSERT INTO revenue_by_month AS r (month, contracts_count, contracts_amount, contract_days, payments_count, payments_amount)
+        VALUES (date_trunc('month', p_start)::date, p_sign, v_amount, p_sign * v_days, 0, 0)
+        ON CONFLICT (month) DO UPDATE SET
+            contracts_count = r.contracts_count + EXCLUDED.contracts_count,
+            contracts_amount = r.contracts_amount + EXCLUDED.contracts_amount,
+            contract_days = r.contract_days + EXCLUDED.contract_days;
+    END IF;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION apply_payment_summary(
+    p_car_id integer, p_date date, p_amount double precision, p_sign integer
+) RETURNS void AS $$
+DECLARE
+    v_amount double precision := p_sign * COALESCE(p_amount, 0);
+BEGIN
+    IF p_car_id IS NOT NULL THEN
+        INSERT INTO revenue_by_car AS r (car_id, contracts_count, contracts_amount, contract_days, payments_count, payments_amount)
+        VALUES (p_car_id, 0, 0, 0, p_sign, v_amount)
+        ON CONFLICT (car_id) DO UPDATE SET
+            payments_count = r.payments_count + EXCLUDED.payments_count,
+            payments_amount = r.payments_amount + EXCLUDED.payments_amount;
+    END IF;
+    IF p_date IS NOT NULL THEN
+        INSERT INTO revenue_by_month AS r (month, contracts_count, contracts_amount, contract_days, payments_count, payments_amount)
+        VALUES (date_trunc('month', p_date)::date, 0, 0, 0, p_sign, v_amount)
+        ON CONFLICT (month) DO UPDATE SET
+            payments_count = r.payments_count + EXCLUDED.payments_count,
+            payments_amount = r.payments_amount + EXCLUDED.payments_amount;
+    END IF;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION contracts_summary() RETURNS trigger AS $$
+BEGIN
+    -- Перенос в архив и перестройка таблицы платежей не меняют сводки
+    IF current_setting('app.skip_summaries', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_contract_summary(OLD.car_id, OLD.start_date, OLD.end_date, OLD.amount, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_contract_summary(NEW.car_id, NEW.start_date, NEW.end_date, NEW.amount, 1);
+    END IF;
+    -- Платежи договора, переведённого на другой автомобиль, переносятся вместе с ним
+    IF TG_OP = 'UPDATE' AND NEW.car_id IS DISTINCT FROM OLD.car_id THEN
+        PERFORM apply_payment_summary(OLD.car_id, NULL, p.amount, -1),
+                apply_payment_summary(NEW.car_id, NULL, p.amount, 1)
+        FROM payments p WHERE p.contract_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION payments_summary() RETURNS trigger AS $$
+BEGIN
+    -- Перенос в архив и перестройка таблицы платежей не меняют сводки
+    IF current_setting('app.skip_summaries', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_payment_summary(
+            (SELECT car_id FROM contracts WHERE id = OLD.contract_id), OLD.date, OLD.amount, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_payment_summary(
+            (SELECT car_id FROM contracts WHERE id = NEW.contract_id), NEW.date, NEW.amount, 1);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+""")
+
+# Смена только статуса договора не затрагивает сводки
+CONTRACTS_SUMMARY_TRIGGER = (
+    "CREATE TRIGGER contracts_summary AFTER INSERT OR DELETE OR UPDATE OF car_id, start_date, end_date, amount "
+    "ON contracts FOR EACH ROW EXECUTE FUNCTION contracts_summary()"
+)
+PAYMENTS_SUMMARY_TRIGGER = (
+    "CREATE TRIGGER payments_summary AFTER INSERT OR DELETE OR UPDATE "
+    "ON payments FOR EACH ROW EXECUTE FUNCTION payments_summary()"
+)
+
+event.listen(Base.metadata, "before_create", SUMMARY_FUNCTIONS)
+event.listen(Base.metadata.tables["contracts"], "after_create", DDL(CONTRACTS_SUMMARY_TRIGGER))
+event.listen(Base.metadata.tables["payments"], "after_create", DDL(PAYMENTS_SUMMARY_TRIGGER))
+
+# Сводки затрат на обслуживание по автомобилям и по месяцам.
+# Поддерживаются строковым триггером на maintenances в той же транзакции.
+class MaintenanceByCar(Base):
+    __tablename__ = "maintenance_by_car"
+    car_id = Column(Integer, primary_key=True)
+    services_count = Column(BigInteger, nullable=False, default=0)
+    total_cost = Column(Float, nullable=False, default=0)
+    last_date = Column(Date)
+
+class MaintenanceByMonth(Base):
+    __tablename__ = "maintenance_by_month"
+    month = Column(Date, primary_key=True)
+    services_count = Column(BigInteger, nullable=False, default=0)
+    total_cost = Column(Float, nullable=False, default=0)
+
+MAINTENANCE_SUMMARY_FUNCTIONS = DDL("""
+CREATE OR REPLACE FUNCTION apply_maintenance_summary(
+    p_car_id integer, p_date date, p_cost double precision, p_sign integer
+) RETURNS void AS $$
+DECLARE
+    v_cost double precision := p_sign * COALESCE(p_cost, 0);
+BEGIN
+    IF p_car_id IS NOT NULL THEN
+        INSERT INTO maintenance_by_car AS m (car_id, services_count, total_cost, last_date)
+        VALUES (p_car_id, p_sign, v_cost, CASE WHEN p_sign > 0 THEN p_date END)
+        ON CONFLICT (car_id) DO UPDATE SET
+            services_count = m.services_count + EXCLUDED.services_count,
+            total_cost = m.total_cost + EXCLUDED.total_cost,
+            last_date = GREATEST(m.last_date, EXCLUDED.last_date);
+        -- Удалённая запись могла быть последней: дата пересчитывается по индексу (car_id, date)
+        IF p_sign < 0 THEN
+            UPDATE maintenance_by_car
+            SET last_date = (SELECT max(date) FROM maintenances WHERE car_id = p_car_id)
+            WHERE car_id = p_car_id AND last_date IS NOT DISTINCT FROM p_date;
+        END IF;
+    END IF;
+    IF p_date IS NOT NULL THEN
+        INSERT INTO maintenance_by_month AS m (month, services_count, total_cost)
+        VALUES (date_trunc('month', p_date)::date, p_sign, v_cost)
+        ON CONFLICT (month) DO UPDATE SET
+            services_count = m.services_count + EXCLUDED.services_count,
+            total_cost = m.total_cost + EXCLUDED.total_cost;
+    END IF;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION maintenances_summary() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_maintenance_summary(OLD.car_id, OLD.date, OLD.cost, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_maintenance_summary(NEW.car_id, NEW.date, NEW.cost, 1);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+""")
+
+MAINTENANCES_SUMMARY_TRIGGER = (
+    "CREATE TRIGGER maintenances_summary AFTER INSERT OR DELETE OR UPDATE OF car_id, date, cost "
+    "ON maintenances FOR EACH ROW EXECUTE FUNCTION maintenances_summary()"
+)
+
+event.listen(Base.metadata, "before_create", MAINTENANCE_SUMMARY_FUNCTIONS)
+event.listen(Base.metadata.tables["maintenances"], "after_create", DDL(MAINTENANCES_SUMMARY_TRIGGER))
@@ -0,0 +1,175 @@
+from sqlalchemy import select
+
+from .models import Brand, Model, Parking, Employee, Payment, Insurance, Maintenance, Client, Car, Contract
+
+# Колоночные проекции для read-only списков и выгрузки: Core select() только
+# нужных столбцов, строки результата сразу превращаются в словари без
+# создания ORM-объектов и identity map.
+#
+# Поля задаются как {имя в ответе: столбец}; для вложенных объектов столбцы
+# получают префикс (client_, car_, contract_).
+BRAND_FIELDS = {"id": Brand.id, "name": Brand.name}
+MODEL_FIELDS = {"id": Model.id, "name": Model.name}
+PARKING_FIELDS = {"id": Parking.id, "name": Parking.name}
+EMPLOYEE_FIELDS = {"id": Employee.id, "full_name": Employee.full_name}
+
+PAYMENT_FIELDS = {
+    "id": Payment.id,
+    "contract_id": Payment.contract_id,
+    "date": Payment.date,
+    "amount": Payment.amount,
+}
+
+CLIENT_FIELDS = {
+    "id": Client.id,
+    "full_name": Client.full_name,
+    "phone": Client.phone,
+    "license_number": Client.license_number,
+    "birth_date": Client.birth_date,
+}
+
+CAR_FIELDS = {
+    "id": Car.id,
+    "brand": Brand.name,
+    "model": Model.name,
+    "year": Car.year,
+    "color": Car.color,
+    "license_plate": Car.plate,
+    "price": Car.price,
+}
+
+CONTRACT_FIELDS = {
+    "id": Contract.id,
+    "start_date": Contract.start_date,
+    "end_date": Contract.end_date,
+    "payment_date": Contract.payment_date,
+    "amount": Contract.amount,
+    "status": Contract.status,
+}
+
+INSURANCE_FIELDS = {"id": Insurance.id, "cost": Insurance.cost}
+
+MAINTENANCE_FIELDS = {
+    "id": Maintenance.id,
+    "description": Maintenance.description,
+    "date": Maintenance.date,
+    "cost": Maintenance.cost,
+}
+
+def columns(fields, prefix=""):
+    return [column.label(prefix + name) for name, column in fields.items()]
+
+def flat_select(fields):
+    return select(*columns(fields))
+
+# Названия марки и модели автомобиля берутся из справочников; внешнее
+# соединение сохраняет автомобили без марки или модели
+def join_car_names(stmt, car=Car.__table__):
+    return (
+        stmt.outerjoin(Brand, car.c.brand_id == Brand.id)
+        .outerjoin(Model, car.c.model_id == Model.id)
+    )
+
+def cars_select():
+    return join_car_names(select(*columns(CAR_FIELDS)).select_from(Car))
+
+def contracts_select():
+    return join_car_names(
+        select(*columns(CONTRACT_FIELDS), *columns(CLIENT_FIELDS, "client_"), *columns(CAR_FIELDS, "car_"))
+        .join_from(Contract, Client, Contract.client_id == Client.id)
+        .join(Car, Contract.car_id == Car.id)
+    )
+
+def insurances_select():
+    return join_car_names(
+        select(
+            *columns(INSURANCE_FIELDS),
+            *columns(CONTRACT_FIELDS, "contract_"),
+            *columns(CLIENT_FIELDS, "client_"),
+            *columns(CAR_FIELDS, "car_"),
+        )
+        .join_from(Insurance, Contract, Insurance.contract_id == Contract.id)
+        .join(Client, Contract.client_id == Client.id)
+        .join(Car, Contract.car_id == Car.id)
+    )
+
+def maintenances_select():
+    return join_car_names(
+        select(*columns(MAINTENANCE_FIELDS), *columns(CAR_FIELDS, "car_"))
+        .join_from(Maintenance, Car, Maintenance.car_id == Car.id)
+    )
+
+# Путь записи: INSERT/UPDATE ... RETURNING оборачивается в CTE и сразу
+# соединяется со связанными таблицами, так что данные для ответа приходят
+# тем же запросом, что и изменение
+def written(dml, model):
+    return dml.returning(*model.__table__.c).cte("written")
+
+def cte_columns(cte, fields, prefix=""):
+    return [cte.c[column.key].label(prefix + name) for name, column in fields.items()]
+
+def written_contract_select(dml):
+    w = written(dml, Contract)
+    return join_car_names(
+        select(*cte_columns(w, CONTRACT_FIELDS), *columns(CLIENT_FIELDS, "client_"), *columns(CAR_FIELDS, "car_"))
+        .select_from(w)
+        .join(Client, w.c.client_id == Client.id)
+        .join(Car, w.c.car_id == Car.id)
+    )
+
+def written_insurance_select(dml):
+    w = written(dml, Insurance)
+    return join_car_names(
+        select(
+            *cte_columns(w, INSURANCE_FIELDS),
+            *columns(CONTRACT_FIELDS, "contract_"),
+            *columns(CLIENT_FIELDS, "client_"),
+            *columns(CAR_FIELDS, "car_"),
+        )
+        .select_from(w)
+        .join(Contract, w.c.contract_id == Contract.id)
+        .join(Client, Contract.client_id == Client.id)
+        .join(Car, Contract.car_id == Car.id)
+    )
+
+def written_maintenance_select(dml):
+    w = written(dml, Maintenance)
+    return join_car_names(
+        select(*cte_columns(w, MAINTENANCE_FIELDS), *columns(CAR_FIELDS, "car_"))
+        .select_from(w)
+        .join(Car, w.c.car_id == Car.id)
+    )
+
+# Столбцы самого автомобиля читаются из CTE, названия — из справочников
+def written_car_select(dml):
+    w = written(dml, Car)
+    fields = {
+        name: w.c[column.key] if column.class_ is Car else column
+        for name, column in CAR_FIELDS.items()
+    }
+    return join_car_names(select(*columns(fields)).select_from(w), w)
+
+# Преобразование строк результата в словари формы *Response
+# (даты orjson сериализует в ISO-формат сам)
+def _pick(row, fields, prefix=""):
+    return {name: row[prefix + name] for name in fields}
+
+def flat_row(row):
+    return dict(row._mapping)
+
+def contract_row(row, prefix=""):
+    m = row._mapping
+    contract = _pick(m, CONTRACT_FIELDS, prefix)
+    contract["client"] = _pick(m, CLIENT_FIELDS, "client_")
+    contract["car"] = _pick(m, CAR_FIELDS, "car_")
+    return contract
+
+def insurance_row(row):
+    m = row._mapping
+    return {"id": m["id"], "contract": contract_row(row, "contract_"), "cost": m["cost"]}
+
+def maintenance_row(row):
+    m = row._mapping
+    maintenance = _pick(m, MAINTENANCE_FIELDS)
+    maintenance["car"] = _pick(m, CAR_FIELDS, "car_")
+    return maintenance
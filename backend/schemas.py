@@ -124,3 +124,45 @@ class MaintenanceResponse(BaseModel):
     description: str
     date: str
     cost: float
+
+# Результат пакетного создания: id созданной записи или причина отказа
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+# Схемы для аналитики
+class RevenueMonthResponse(BaseModel):
+    month: str
+    contracts_count: int
+    contracts_amount: float
+    payments_count: int
+    payments_amount: float
+    avg_contract_days: Optional[float] = None
+
+class RevenueCarResponse(BaseModel):
+    car: CarResponse
+    contracts_count: int
+    contracts_amount: float
+    payments_count: int
+    payments_amount: float
+    avg_contract_days: Optional[float] = None
+
+class ContractSummaryResponse(BaseModel):
+    contracts_count: int
+    contracts_amount: float
+    payments_count: int
+    payments_amount: float
+    avg_contract_days: Optional[float] = None
+    avg_contract_amount: Optional[float] = None
+
+class MaintenanceCarSummaryResponse(BaseModel):
+    car: CarResponse
+    services_count: int
+    total_cost: float
+    last_date: Optional[str] = None
+
+class MaintenanceMonthSummaryResponse(BaseModel):
+    month: str
+    services_count: int
+    total_cost: float
@@ -0,0 +1,21 @@
+from typing import Optional
+
+import orjson
+from fastapi import Response
+
+# Заголовки, выставленные обработчиком и зависимостями, которые нужно
+# перенести в итоговый ответ
+PASSTHROUGH_HEADERS = ("X-Next-Cursor", "ETag", "Cache-Control")
+
+# Готовые словари отдаются через orjson без повторной валидации по
+# response_model (response_model остаётся для документации; соответствие
+# ответов схемам проверяет tests/test_responses.py).
+# Сами словари строятся из строк Core-запросов, см. projections.py.
+def fast_json(content, response: Optional[Response] = None):
+    headers = {}
+    if response is not None:
+        for name in PASSTHROUGH_HEADERS:
+            if name in response.headers:
+                headers[name] = response.headers[name]
+    body = orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,153 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+
+from .metrics import current_endpoint
+
+logger = logging.getLogger(__name__)
+
+# Журнал медленных запросов включается порогом SLOW_QUERY_MS (мс);
+# без него обработчики событий не подключаются вовсе
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+# Порог для снятия плана EXPLAIN (ANALYZE, BUFFERS): по умолчанию в 5 раз выше
+SLOW_QUERY_EXPLAIN_MS = float(os.getenv("SLOW_QUERY_EXPLAIN_MS", str(SLOW_QUERY_MS * 5)))
+# Один и тот же текст запроса объясняется не чаще раза в интервал (секунды):
+# EXPLAIN ANALYZE выполняет запрос повторно
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+# Размер кольцевого буфера последних медленных запросов
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "200"))
+
+# Текст запроса в журнале обрезается, параметры не сохраняются (в них
+# персональные данные клиентов)
+MAX_STATEMENT_LENGTH = 2000
+
+# Кольцевой буфер медленных запросов с планами для самых медленных
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, explain_ms: float, explain_interval: float, size: int):
+        self.threshold_ms = threshold_ms
+        self.explain_ms = explain_ms
+        self.explain_interval = explain_interval
+        self._entries = deque(maxlen=size)
+        self._explained = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def add(self, entry: dict):
+        with self._lock:
+            self._entries.append(entry)
+
+    # Нужно ли снимать план: запрос медленнее порога EXPLAIN и этот текст
+    # не объяснялся в течение explain_interval
+    def should_explain(self, statement: str, duration_ms: float) -> bool:
+        if duration_ms < self.explain_ms:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained.get(statement)
+            if last is not None and now - last < self.explain_interval:
+                return False
+            self._explained[statement] = now
+            return True
+
+    def entries(self, limit: int, with_plans: bool = False):
+        with self._lock:
+            entries = list(self._entries)[-limit:][::-1]
+        if with_plans:
+            entries = [e for e in entries if e["plan"] is not None]
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold_ms,
+            "explain_ms": self.explain_ms,
+            "entries": entries,
+        }
+
+slow_query_log = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN_MS, SLOW_QUERY_EXPLAIN_INTERVAL, SLOW_QUERY_LOG_SIZE)
+
+# План снимается на том же соединении и в той же транзакции (видны её
+# незафиксированные изменения) внутри SAVEPOINT. ANALYZE выполняет запрос
+# повторно, поэтому после EXPLAIN изменения всегда откатываются к точке
+# сохранения (даже при успехе), а ошибка EXPLAIN не прерывает транзакцию
+# обработчика.
+def explain(conn, statement: str, parameters):
+    cursor = conn.connection.cursor()
+    savepoint = False
+    try:
+        cursor.execute("SAVEPOINT slow_query_explain")
+        savepoint = True
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+        return "\n".join(row[0] for row in cursor.fetchall())
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+    finally:
+        if savepoint:
+            cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        cursor.close()
+
+# Объясняются только SELECT без функций, изменения которых не откатываются
+# (последовательности)
+NON_TRANSACTIONAL_CALLS = ("NEXTVAL(", "SETVAL(")
+
+def is_select(statement: str) -> bool:
+    statement = statement.lstrip().upper()
+    return statement.startswith("SELECT") and not any(call in statement for call in NON_TRANSACTIONAL_CALLS)
+
+# EXPLAIN возможен только в открытой исправной транзакции: без неё
+# (AUTOCOMMIT, например миграции с CREATE INDEX CONCURRENTLY) нет точки
+# сохранения, а в прерванной транзакции любой запрос завершится ошибкой.
+# Состояние берётся у драйвера: info.transaction_status у psycopg2 и
+# psycopg 3 (2 — INTRANS), is_in_transaction() у asyncpg.
+TRANSACTION_STATUS_INTRANS = 2
+
+def in_open_transaction(dbapi_connection) -> bool:
+    status = getattr(getattr(dbapi_connection, "info", None), "transaction_status", None)
+    if status is not None:
+        return status == TRANSACTION_STATUS_INTRANS
+    raw = getattr(dbapi_connection, "_connection", None)
+    return raw is not None and raw.is_in_transaction()
+
+# Подключение журнала к движку (для асинхронного — к его sync_engine)
+def attach_slow_query_log(engine):
+    if not slow_query_log.enabled:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - conn.info["slow_query_started"].pop()) * 1000
+        if duration_ms < slow_query_log.threshold_ms:
+            return
+        endpoint = current_endpoint()
+        plan = None
+        if (
+            not executemany
+            and is_select(statement)
+            and in_open_transaction(conn.connection.dbapi_connection)
+            and slow_query_log.should_explain(statement, duration_ms)
+        ):
+            plan = explain(conn, statement, parameters)
+        slow_query_log.add({
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(duration_ms, 3),
+            "endpoint": endpoint,
+            "statement": statement[:MAX_STATEMENT_LENGTH],
+            "plan": plan,
+        })
+        logger.warning("slow query %.1fms endpoint=%s: %s", duration_ms, endpoint, statement[:MAX_STATEMENT_LENGTH])
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        started = exception_context.connection.info.get("slow_query_started") if exception_context.connection else None
+        if started:
+            started.pop()
@@ -0,0 +1,84 @@
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Car, Contract
+
+# Максимальная длина окна отчёта в днях
+MAX_UTILIZATION_DAYS = 3660
+
+# Интервалы договоров, пересекающих окно, загружаются колонками; даты сразу
+# переводятся в смещения от начала окна на стороне Postgres
+async def load_intervals(db: AsyncSession, start: date, end: date):
+    car_ids = (await db.execute(select(Car.id).order_by(Car.id))).scalars().all()
+    rows = (await db.execute(
+        select(Contract.car_id, Contract.start_date - start, Contract.end_date - start)
+        .where(
+            Contract.car_id.isnot(None),
+            Contract.start_date <= end,
+            Contract.end_date >= start,
+            Contract.end_date >= Contract.start_date,
+        )
+    )).all()
+    intervals = np.array(rows, dtype=np.int64).reshape(-1, 3)
+    return np.array(car_ids, dtype=np.int64), intervals[:, 0], intervals[:, 1], intervals[:, 2]
+
+# Занятые периоды автомобилей: договоры одного автомобиля, пересекающиеся
+# или идущие подряд, сливаются в один период, поэтому каждый день считается
+# один раз. Интервалы целиком вне окна отбрасываются до обрезки по границам
+# окна, иначе обрезка сдвинула бы их на первый или последний день. Память —
+# O(договоров), без матрицы автомобили x дни: к дню каждого интервала
+# прибавляется смещение строки автомобиля, и интервалы всех автомобилей
+# сливаются одной сортировкой и накопленным максимумом концов.
+# Возвращает строки автомобилей в car_ids и дни начала и конца периодов.
+def merged_intervals(car_ids, contract_cars, starts, ends, days: int):
+    empty = np.zeros(0, dtype=np.int64)
+    if len(car_ids) == 0:
+        return empty, empty, empty
+    rows = np.searchsorted(car_ids, contract_cars)
+    known = (rows < len(car_ids)) & (car_ids[np.minimum(rows, len(car_ids) - 1)] == contract_cars)
+    known &= (ends >= 0) & (starts < days) & (ends >= starts)
+    if not known.any():
+        return empty, empty, empty
+    offsets = rows[known].astype(np.int64) * (days + 1)
+    starts = np.clip(starts[known], 0, days - 1) + offsets
+    ends = np.clip(ends[known], 0, days - 1) + offsets
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    first = np.flatnonzero(np.r_[True, starts[1:] > reach[:-1] + 1])
+    last = np.r_[first[1:] - 1, len(starts) - 1]
+    rows = starts[first] // (days + 1)
+    return rows, starts[first] - rows * (days + 1), reach[last] - rows * (days + 1)
+
+def utilization_report(car_ids, contract_cars, starts, ends, start: date, days: int, include_daily: bool):
+    rows, starts, ends = merged_intervals(car_ids, contract_cars, starts, ends, days)
+    rented_days = np.bincount(rows, weights=ends - starts + 1, minlength=len(car_ids)).astype(np.int64)
+    report = {
+        "start": start.isoformat(),
+        "end": (start + timedelta(days=days - 1)).isoformat(),
+        "days": days,
+        "fleet_utilization": float(rented_days.sum() / (len(car_ids) * days)) if len(car_ids) else 0.0,
+        "cars": [
+            {"car_id": int(car_id), "rented_days": int(rented), "utilization": float(rented) / days}
+            for car_id, rented in zip(car_ids, rented_days)
+        ],
+    }
+    if include_daily:
+        # Периоды одного автомобиля не пересекаются: разностный массив по
+        # дням (+1 в день начала, -1 после дня окончания) даёт число занятых
+        rented = np.zeros(days + 1, dtype=np.int64)
+        np.add.at(rented, starts, 1)
+        np.add.at(rented, ends + 1, -1)
+        rented_cars = np.cumsum(rented[:days])
+        report["daily"] = [
+            {
+                "date": (start + timedelta(days=i)).isoformat(),
+                "rented_cars": int(count),
+                "utilization": float(count) / len(car_ids) if len(car_ids) else 0.0,
+            }
+            for i, count in enumerate(rented_cars)
+        ]
+    return report
@@ -0,0 +1,376 @@
+# Нагрузочный тест API: смешанная нагрузка чтения и записи по всем роутерам
+# backend.endpoints против запущенного сервера. Результат — JSON с p50/p95/p99
+# и пропускной способностью по каждому эндпоинту, пригодный для сравнения
+# версий между собой.
+#
+# Перед запуском база заполняется benchmarks.datagen (его манифест задаёт
+# диапазоны id), сервер запускается отдельно:
+#   python -m benchmarks.datagen --database-url ... --manifest dataset.json
+#   uvicorn backend.main:app --workers 4
+#   python -m benchmarks.load --manifest dataset.json --duration 60 --concurrency 32 --output run.json
+#
+# Клиент — http.client из стандартной библиотеки с постоянным соединением
+# на поток, чтобы накладные расходы генератора нагрузки были минимальны.
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+
+# Операции нагрузки: (имя эндпоинта, тип, вес, построитель запроса).
+# Построитель получает генератор случайных чисел и контекст потока и
+# возвращает (метод, путь, тело).
+OPERATIONS = []
+
+def operation(name: str, kind: str, weight: int):
+    def register(build):
+        OPERATIONS.append((name, kind, weight, build))
+        return build
+    return register
+
+def query(path: str, **params):
+    params = {k: v for k, v in params.items() if v is not None}
+    return f"{path}?{urlencode(params)}" if params else path
+
+def random_id(rng, ctx, table: str):
+    return rng.randint(1, max(ctx.max_ids[table], 1))
+
+def random_period(rng, ctx, max_days: int = 14):
+    start = ctx.anchor - timedelta(days=rng.randrange(ctx.history_days))
+    return start, start + timedelta(days=rng.randrange(max_days))
+
+# Чтение
+
+@operation("GET /brands", "read", 3)
+def get_brands(rng, ctx):
+    return "GET", "/brands", None
+
+@operation("GET /models", "read", 3)
+def get_models(rng, ctx):
+    return "GET", "/models", None
+
+@operation("GET /parkings", "read", 1)
+def get_parkings(rng, ctx):
+    return "GET", "/parkings", None
+
+@operation("GET /employees", "read", 1)
+def get_employees(rng, ctx):
+    return "GET", "/employees", None
+
+@operation("GET /payments", "read", 4)
+def get_payments(rng, ctx):
+    roll = rng.random()
+    if roll < 0.4:
+        return "GET", query("/payments", contract_id=random_id(rng, ctx, "contracts")), None
+    if roll < 0.7:
+        # Фильтр по дате затрагивает одну-две месячные секции payments
+        start, end = random_period(rng, ctx, 31)
+        return "GET", query("/payments", limit=100, date_from=start.isoformat(), date_to=end.isoformat()), None
+    return "GET", query("/payments", limit=100, after=random_id(rng, ctx, "payments")), None
+
+@operation("GET /insurances", "read", 2)
+def get_insurances(rng, ctx):
+    return "GET", query("/insurances", limit=100, after=random_id(rng, ctx, "insurances")), None
+
+@operation("GET /maintenances", "read", 2)
+def get_maintenances(rng, ctx):
+    if rng.random() < 0.5:
+        return "GET", query("/maintenances", car_id=random_id(rng, ctx, "cars")), None
+    return "GET", query("/maintenances", limit=100, after=random_id(rng, ctx, "maintenances")), None
+
+@operation("GET /clients", "read", 3)
+def get_clients(rng, ctx):
+    return "GET", query("/clients", limit=100, after=random_id(rng, ctx, "clients")), None
+
+@operation("GET /clients/search", "read", 4)
+def search_clients(rng, ctx):
+    return "GET", query("/clients/search", q=f"L{random_id(rng, ctx, 'clients')}"), None
+
+@operation("GET /cars", "read", 4)
+def get_cars(rng, ctx):
+    return "GET", query("/cars", limit=100, after=random_id(rng, ctx, "cars")), None
+
+@operation("GET /cars/search", "read", 2)
+def search_cars(rng, ctx):
+    return "GET", query("/cars/search", q=f"P{random_id(rng, ctx, 'cars')}"), None
+
+@operation("GET /available-cars", "read", 6)
+def get_available_cars(rng, ctx):
+    start, end = random_period(rng, ctx)
+    return "GET", query("/available-cars", start=start.isoformat(), end=end.isoformat()), None
+
+@operation("GET /contracts", "read", 8)
+def get_contracts(rng, ctx):
+    choice = rng.random()
+    if choice < 0.4:
+        return "GET", query("/contracts", client_id=random_id(rng, ctx, "clients")), None
+    if choice < 0.7:
+        return "GET", query("/contracts", car_id=random_id(rng, ctx, "cars"), status="active"), None
+    return "GET", query("/contracts", limit=100, after=random_id(rng, ctx, "contracts")), None
+
+@operation("GET /analytics/revenue/monthly", "read", 2)
+def get_revenue_monthly(rng, ctx):
+    return "GET", "/analytics/revenue/monthly", None
+
+@operation("GET /analytics/revenue/cars", "read", 1)
+def get_revenue_cars(rng, ctx):
+    return "GET", "/analytics/revenue/cars", None
+
+@operation("GET /analytics/contracts/summary", "read", 2)
+def get_contract_summary(rng, ctx):
+    return "GET", "/analytics/contracts/summary", None
+
+@operation("GET /analytics/maintenance/cars", "read", 1)
+def get_maintenance_cars(rng, ctx):
+    return "GET", "/analytics/maintenance/cars", None
+
+@operation("GET /analytics/maintenance/monthly", "read", 1)
+def get_maintenance_monthly(rng, ctx):
+    return "GET", "/analytics/maintenance/monthly", None
+
+@operation("GET /analytics/utilization", "read", 1)
+def get_utilization(rng, ctx):
+    start, _ = random_period(rng, ctx)
+    end = start + timedelta(days=30)
+    return "GET", query("/analytics/utilization", start=start.isoformat(), end=end.isoformat(), include_daily="false"), None
+
+@operation("GET /pool-stats", "read", 1)
+def get_pool_stats(rng, ctx):
+    return "GET", "/pool-stats", None
+
+# Запись. Уникальные значения строятся из идентификатора прогона, номера
+# потока и счётчика, чтобы повторные прогоны не упирались в 400.
+
+@operation("POST /brands", "write", 1)
+def create_brand(rng, ctx):
+    return "POST", "/brands", {"name": f"Brand {ctx.unique()}"}
+
+@operation("POST /employees", "write", 1)
+def create_employee(rng, ctx):
+    return "POST", "/employees", {"full_name": f"Employee {ctx.unique()}"}
+
+@operation("POST /clients", "write", 4)
+def create_client(rng, ctx):
+    tag = ctx.unique()
+    return "POST", "/clients", {
+        "full_name": f"Client {tag}",
+        "phone": f"+7{rng.randrange(10 ** 10):010d}",
+        "license_number": f"B{tag}",
+        "birth_date": (date(1960, 1, 1) + timedelta(days=rng.randrange(15000))).isoformat(),
+    }
+
+@operation("POST /cars", "write", 2)
+def create_car(rng, ctx):
+    return "POST", "/cars", {
+        "brand": "Lada", "model": "Model 1", "year": rng.randint(2005, 2024),
+        "color": "white", "plate": f"B{ctx.unique()}", "price": round(rng.uniform(1000, 10000), 2),
+    }
+
+# Новые договоры бронируются в далёком будущем: пересечения редки, а
+# отказы 409 попадают в статистику статусов
+@operation("POST /contracts", "write", 6)
+def create_contract(rng, ctx):
+    start = date(2100, 1, 1) + timedelta(days=rng.randrange(36500))
+    end = start + timedelta(days=rng.randrange(14))
+    return "POST", "/contracts", {
+        "client_id": random_id(rng, ctx, "clients"),
+        "car_id": random_id(rng, ctx, "cars"),
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "payment_date": start.isoformat(),
+        "amount": round(rng.uniform(1000, 50000), 2),
+    }
+
+@operation("PUT /contracts/{contract_id}/complete", "write", 2)
+def complete_contract(rng, ctx):
+    return "PUT", f"/contracts/{random_id(rng, ctx, 'contracts')}/complete", None
+
+@operation("POST /payments", "write", 6)
+def create_payment(rng, ctx):
+    start, _ = random_period(rng, ctx)
+    return "POST", "/payments", {
+        "contract_id": random_id(rng, ctx, "contracts"),
+        "date": start.isoformat(),
+        "amount": round(rng.uniform(100, 10000), 2),
+    }
+
+@operation("POST /payments/bulk", "write", 1)
+def create_payments_bulk(rng, ctx):
+    start, _ = random_period(rng, ctx)
+    return "POST", "/payments/bulk", [
+        {"contract_id": random_id(rng, ctx, "contracts"), "date": start.isoformat(),
+         "amount": round(rng.uniform(100, 10000), 2)}
+        for _ in range(50)
+    ]
+
+@operation("PUT /payments/{payment_id}", "write", 2)
+def update_payment(rng, ctx):
+    start, _ = random_period(rng, ctx)
+    return "PUT", f"/payments/{random_id(rng, ctx, 'payments')}", {
+        "contract_id": random_id(rng, ctx, "contracts"),
+        "date": start.isoformat(),
+        "amount": round(rng.uniform(100, 10000), 2),
+    }
+
+@operation("POST /insurances", "write", 2)
+def create_insurance(rng, ctx):
+    return "POST", "/insurances", {
+        "contract_id": random_id(rng, ctx, "contracts"),
+        "cost": round(rng.uniform(500, 2500), 2),
+    }
+
+@operation("POST /maintenances", "write", 2)
+def create_maintenance(rng, ctx):
+    start, _ = random_period(rng, ctx)
+    return "POST", "/maintenances", {
+        "car_id": random_id(rng, ctx, "cars"),
+        "description": "Diagnostics",
+        "date": start.isoformat(),
+        "cost": round(rng.uniform(1000, 20000), 2),
+    }
+
+# Контекст потока: диапазоны id из манифеста и генератор уникальных меток
+class WorkerContext:
+    def __init__(self, manifest: dict, run_id: str, worker: int):
+        self.max_ids = manifest["max_ids"]
+        self.anchor = date.fromisoformat(manifest["anchor"])
+        self.history_days = max(manifest["history_days"], 1)
+        self.prefix = f"{run_id}-{worker}"
+        self.counter = 0
+
+    def unique(self) -> str:
+        self.counter += 1
+        return f"{self.prefix}-{self.counter}"
+
+class Worker(threading.Thread):
+    def __init__(self, base_url: str, manifest: dict, run_id: str, index: int, seed: int,
+                 write_ratio: float, deadline: float, warmup_until: float):
+        super().__init__(daemon=True)
+        url = urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.ctx = WorkerContext(manifest, run_id, index)
+        self.rng = random.Random(seed * 1000 + index)
+        self.write_ratio = write_ratio
+        self.deadline = deadline
+        self.warmup_until = warmup_until
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = 0
+        self.reads = [op for op in OPERATIONS if op[1] == "read"]
+        self.writes = [op for op in OPERATIONS if op[1] == "write"]
+
+    def pick(self):
+        group = self.writes if self.rng.random() < self.write_ratio else self.reads
+        return self.rng.choices(group, weights=[op[2] for op in group])[0]
+
+    def run(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        while True:
+            started = time.perf_counter()
+            if started >= self.deadline:
+                break
+            name, _, _, build = self.pick()
+            method, path, body = build(self.rng, self.ctx)
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            try:
+                conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+                status = None
+            elapsed = time.perf_counter() - started
+            if started < self.warmup_until:
+                continue
+            if status is None:
+                self.errors += 1
+                continue
+            self.latencies.setdefault(name, []).append(elapsed * 1000)
+            statuses = self.statuses.setdefault(name, {})
+            statuses[status] = statuses.get(status, 0) + 1
+        conn.close()
+
+def percentile(sorted_values: list, p: float) -> float:
+    index = max(int(round(p / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+def summarize(values: list, statuses: dict, seconds: float) -> dict:
+    values = sorted(values)
+    return {
+        "requests": len(values),
+        "throughput_rps": round(len(values) / seconds, 2),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+def run(base_url: str, manifest: dict, duration: float, warmup: float, concurrency: int,
+        seed: int, write_ratio: float) -> dict:
+    run_id = f"{int(time.time())}"
+    warmup_until = time.perf_counter() + warmup
+    deadline = warmup_until + duration
+    workers = [
+        Worker(base_url, manifest, run_id, i, seed, write_ratio, deadline, warmup_until)
+        for i in range(concurrency)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    latencies, statuses = {}, {}
+    for worker in workers:
+        for name, values in worker.latencies.items():
+            latencies.setdefault(name, []).extend(values)
+        for name, counts in worker.statuses.items():
+            merged = statuses.setdefault(name, {})
+            for code, count in counts.items():
+                merged[code] = merged.get(code, 0) + count
+    everything = [v for values in latencies.values() for v in values]
+    return {
+        "base_url": base_url,
+        "duration_s": duration,
+        "warmup_s": warmup,
+        "concurrency": concurrency,
+        "seed": seed,
+        "write_ratio": write_ratio,
+        "dataset": manifest["counts"],
+        "connection_errors": sum(w.errors for w in workers),
+        "total": summarize(everything, {}, duration) if everything else None,
+        "endpoints": {
+            name: summarize(values, statuses[name], duration)
+            for name, values in sorted(latencies.items())
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Mixed read/write load test of the API")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--manifest", required=True, help="dataset manifest written by benchmarks.datagen")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    with open(args.manifest, encoding="utf-8") as f:
+        manifest = json.load(f)
+    report = run(args.base_url, manifest, args.duration, args.warmup, args.concurrency,
+                 args.seed, args.write_ratio)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
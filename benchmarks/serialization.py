@@ -0,0 +1,100 @@
+# Сравнение сериализации списка договоров: прежний путь (ручная сборка
+# ContractResponse, повторная валидация по response_model, jsonable_encoder
+# и json) против словарей из backend.projections и orjson.
+#
+#   python -m benchmarks.serialization --rows 50000
+import argparse
+import json
+import time
+from datetime import date
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from backend.models import Brand, Car, Client, Contract, Model
+from backend.schemas import CarResponse, ClientResponse, ContractResponse
+from backend.projections import CAR_FIELDS, CLIENT_FIELDS, CONTRACT_FIELDS, contract_row
+
+# Строка результата Core-запроса: contract_row читает только _mapping
+class Row:
+    def __init__(self, mapping):
+        self._mapping = mapping
+
+def to_row(c):
+    mapping = {name: getattr(c, column.key) for name, column in CONTRACT_FIELDS.items()}
+    mapping.update({"client_" + name: getattr(c.client, column.key) for name, column in CLIENT_FIELDS.items()})
+    # Марка и модель лежат в справочниках: значение берётся из связанного объекта
+    mapping.update({
+        "car_" + name: getattr(c.car if column.class_ is Car else getattr(c.car, name), column.key)
+        for name, column in CAR_FIELDS.items()
+    })
+    return Row(mapping)
+
+def make_contracts(rows: int):
+    client = Client(id=1, full_name="Иванов Иван", phone="+79990000000",
+                    license_number="7700123456", birth_date=date(1990, 1, 1))
+    car = Car(id=1, brand=Brand(id=1, name="Lada"), model=Model(id=1, name="Vesta"), year=2020, color="white",
+              plate="А123АА31", price=2500.0)
+    return [
+        Contract(id=i, client=client, car=car, start_date=date(2024, 1, 1),
+                 end_date=date(2024, 1, 10), payment_date=date(2024, 1, 1),
+                 amount=25000.0, status="active")
+        for i in range(rows)
+    ]
+
+def legacy(contracts):
+    items = [
+        ContractResponse(
+            id=c.id,
+            client=ClientResponse(
+                id=c.client.id,
+                full_name=c.client.full_name,
+                phone=c.client.phone,
+                license_number=c.client.license_number,
+                birth_date=str(c.client.birth_date) if c.client.birth_date else None
+            ),
+            car=CarResponse(
+                id=c.car.id,
+                brand=c.car.brand.name,
+                model=c.car.model.name,
+                year=c.car.year,
+                color=c.car.color,
+                license_plate=c.car.plate,
+                price=c.car.price
+            ),
+            start_date=str(c.start_date),
+            end_date=str(c.end_date),
+            payment_date=str(c.payment_date),
+            amount=c.amount,
+            status=c.status
+        ) for c in contracts
+    ]
+    # FastAPI повторно валидирует результат по response_model
+    items = [ContractResponse(**item.dict()) for item in items]
+    return json.dumps(jsonable_encoder(items)).encode()
+
+def fast(rows):
+    return orjson.dumps([contract_row(row) for row in rows])
+
+def measure(func, items, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(items)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark contract list serialization")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    contracts = make_contracts(args.rows)
+    legacy_ms = measure(legacy, contracts, args.repeat)
+    fast_ms = measure(fast, [to_row(c) for c in contracts], args.repeat)
+    print(f"rows={args.rows} legacy={legacy_ms:.1f}ms fast={fast_ms:.1f}ms "
+          f"speedup={legacy_ms / fast_ms:.1f}x")
+
+if __name__ == "__main__":
+    main()
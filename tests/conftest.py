@@ -0,0 +1,88 @@
+# Тесты работают с настоящим Postgres (нужны расширения pg_trgm и
+# btree_gist): триггеры, ограничения и секционирование не проверить на
+# заглушках. Адрес отдельной базы задаёт TEST_DATABASE_URL, её схема public
+# пересоздаётся при запуске. Без TEST_DATABASE_URL тесты с базой пропускаются.
+#
+#   TEST_DATABASE_URL=postgresql://postgres@localhost/krbd_test python -m pytest -q
+import os
+
+import pytest
+from sqlalchemy import text
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    # backend.database читает адрес при импорте
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+@pytest.fixture(scope="session")
+def engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from backend.database import engine
+    from backend.migrations import prepare_database
+    from backend.models import Base
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+    prepare_database(engine, Base.metadata)
+    return engine
+
+# Каждый тест начинает с пустых таблиц и пустого кэша процесса
+@pytest.fixture
+def db(engine):
+    from backend.cache import cache
+    from backend.models import Base
+
+    tables = [table.name for table in Base.metadata.sorted_tables]
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE"))
+    for table in tables:
+        cache.invalidate(table)
+    return engine
+
+# Один TestClient на сессию: пул asyncpg привязан к его циклу событий
+@pytest.fixture(scope="session")
+def app_client(engine):
+    from fastapi.testclient import TestClient
+    from backend.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def client(app_client, db):
+    return app_client
+
+def sql(engine, statement: str, **params):
+    with engine.begin() as conn:
+        result = conn.execute(text(statement), params)
+        return result.all() if result.returns_rows else None
+
+def sql_value(engine, statement: str, **params):
+    with engine.begin() as conn:
+        return conn.execute(text(statement), params).scalar()
+
+# Создание записей через API; возвращают тело ответа
+def create_client(client, license_number: str = "L1"):
+    response = client.post("/clients", json={
+        "full_name": f"Client {license_number}", "phone": "+79990000000",
+        "license_number": license_number, "birth_date": "1990-01-01",
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def create_car(client, plate: str = "A001AA", brand: str = "Lada", model: str = "Vesta"):
+    response = client.post("/cars", json={
+        "brand": brand, "model": model, "year": 2020, "color": "white", "plate": plate, "price": 2500.0,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def create_contract(client, client_id: int, car_id: int, start: str, end: str, amount: float = 1000.0):
+    response = client.post("/contracts", json={
+        "client_id": client_id, "car_id": car_id, "start_date": start, "end_date": end,
+        "payment_date": start, "amount": amount,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
@@ -0,0 +1,99 @@
+from backend.importer import import_csv
+from conftest import create_car, create_client, create_contract, sql
+
+# Строки сводок с ненулевыми итогами (после переноса договора на другой
+# автомобиль в сводке остаются нулевые строки)
+SUMMARY_ROWS = """
+    SELECT 'car' AS kind, car_id::text, contracts_count, contracts_amount, contract_days, payments_count, payments_amount
+    FROM revenue_by_car WHERE contracts_count <> 0 OR payments_count <> 0
+    UNION ALL
+    SELECT 'month', month::text, contracts_count, contracts_amount, contract_days, payments_count, payments_amount
+    FROM revenue_by_month WHERE contracts_count <> 0 OR payments_count <> 0
+    ORDER BY 1, 2
+"""
+
+# Пересчёт сводок с нуля по рабочим таблицам — эталон для сравнения
+REBUILT_ROWS = """
+    WITH c AS (
+        SELECT car_id, date_trunc('month', start_date)::date AS month,
+               COALESCE(amount, 0) AS amount, COALESCE(end_date - start_date + 1, 0) AS days
+        FROM contracts
+    ), p AS (
+        SELECT ct.car_id, date_trunc('month', p.date)::date AS month, COALESCE(p.amount, 0) AS amount
+        FROM payments p JOIN contracts ct ON ct.id = p.contract_id
+    ), keys AS (
+        SELECT 'car' AS kind, car_id::text AS key FROM c UNION SELECT 'car', car_id::text FROM p
+        UNION SELECT 'month', month::text FROM c UNION SELECT 'month', month::text FROM p
+    )
+    SELECT k.kind, k.key,
+           (SELECT count(*) FROM c WHERE (k.kind = 'car' AND c.car_id::text = k.key) OR (k.kind = 'month' AND c.month::text = k.key)),
+           (SELECT COALESCE(sum(amount), 0) FROM c WHERE (k.kind = 'car' AND c.car_id::text = k.key) OR (k.kind = 'month' AND c.month::text = k.key)),
+           (SELECT COALESCE(sum(days), 0) FROM c WHERE (k.kind = 'car' AND c.car_id::text = k.key) OR (k.kind = 'month' AND c.month::text = k.key)),
+           (SELECT count(*) FROM p WHERE (k.kind = 'car' AND p.car_id::text = k.key) OR (k.kind = 'month' AND p.month::text = k.key)),
+           (SELECT COALESCE(sum(amount), 0) FROM p WHERE (k.kind = 'car' AND p.car_id::text = k.key) OR (k.kind = 'month' AND p.month::text = k.key))
+    FROM keys k
+    ORDER BY 1, 2
+"""
+
+def test_contract_summary_totals(client, db):
+    assert client.get("/analytics/contracts/summary").json()["avg_contract_days"] is None
+
+    owner = create_client(client)
+    car = create_car(client)
+    create_contract(client, owner["id"], car["id"], "2024-01-01", "2024-01-10", amount=100.0)
+    create_contract(client, owner["id"], car["id"], "2024-02-01", "2024-02-05", amount=300.0)
+
+    response = client.get("/analytics/contracts/summary")
+    assert response.status_code == 200, response.text
+    summary = response.json()
+    assert summary["contracts_count"] == 2
+    assert summary["contracts_amount"] == 400.0
+    assert summary["avg_contract_days"] == 7.5
+    assert summary["avg_contract_amount"] == 200.0
+
+# Триггеры поддерживают сводки при записи через API
+def test_summaries_follow_api_writes(client, db):
+    owner = create_client(client)
+    car = create_car(client, "A1")
+    other = create_car(client, "A2")
+    contract = create_contract(client, owner["id"], car["id"], "2024-01-20", "2024-02-10", amount=500.0)
+    response = client.post("/payments", json={"contract_id": contract["id"], "date": "2024-02-01", "amount": 200.0})
+    assert response.status_code == 200, response.text
+    response = client.put(f"/contracts/{contract['id']}", json={
+        "client_id": owner["id"], "car_id": other["id"], "start_date": "2024-01-25", "end_date": "2024-02-10",
+        "payment_date": "2024-01-25", "amount": 700.0,
+    })
+    assert response.status_code == 200, response.text
+
+    assert sql(db, SUMMARY_ROWS) == sql(db, REBUILT_ROWS)
+
+# Загрузка из CSV обновляет сводки одним агрегатом по staging
+def test_import_applies_summary_deltas(client, db, tmp_path):
+    create_client(client, "L1")
+    create_car(client, "A1")
+    create_car(client, "A2")
+    contracts = tmp_path / "contracts.csv"
+    contracts.write_text(
+        "client_license_number,car_plate,start_date,end_date,payment_date,amount,status\n"
+        "L1,A1,2023-01-01,2023-01-10,2023-01-01,100,completed\n"
+        "L1,A1,2023-02-01,2023-02-03,2023-02-01,50,completed\n"
+        "L1,A2,2023-01-15,2023-01-16,2023-01-15,30,completed\n"
+        "L9,A2,2023-03-01,2023-03-02,2023-03-01,999,completed\n",
+        encoding="utf-8",
+    )
+    payments = tmp_path / "payments.csv"
+    payments.write_text(
+        "client_license_number,car_plate,contract_start_date,date,amount\n"
+        "L1,A1,2023-01-01,2023-01-01,60\n"
+        "L1,A1,2023-01-01,2023-02-01,40\n"
+        "L1,A2,2023-01-15,2023-01-15,30\n",
+        encoding="utf-8",
+    )
+
+    import_csv("contracts", str(contracts))
+    import_csv("payments", str(payments))
+
+    assert sql(db, SUMMARY_ROWS) == sql(db, REBUILT_ROWS)
+    summary = client.get("/analytics/contracts/summary").json()
+    assert summary["contracts_count"] == 3
+    assert summary["payments_amount"] == 130.0
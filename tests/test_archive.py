@@ -0,0 +1,42 @@
+from datetime import date
+
+from backend.archive import archive_contracts
+from conftest import create_car, create_client, create_contract, sql, sql_value
+
+SUMMARIES = "SELECT * FROM revenue_by_car ORDER BY car_id"
+
+def test_archive_moves_contract_with_payments_and_insurances(client, db):
+    owner = create_client(client)
+    car = create_car(client)
+    old = create_contract(client, owner["id"], car["id"], "2020-01-01", "2020-01-10")
+    recent = create_contract(client, owner["id"], car["id"], "2024-01-01", "2024-01-10")
+    for contract in (old, recent):
+        for day in ("01", "05"):
+            response = client.post("/payments", json={
+                "contract_id": contract["id"], "date": contract["start_date"][:8] + day, "amount": 100.0,
+            })
+            assert response.status_code == 200, response.text
+        response = client.post("/insurances", json={"contract_id": contract["id"], "cost": 50.0})
+        assert response.status_code == 200, response.text
+    for contract in (old, recent):
+        assert client.put(f"/contracts/{contract['id']}/complete").status_code == 200
+    summaries = sql(db, SUMMARIES)
+
+    assert archive_contracts(db, date(2022, 1, 1), batch_size=1) == 1
+
+    assert sql(db, "SELECT id FROM contracts") == [(recent["id"],)]
+    assert sql(db, "SELECT id FROM contracts_archive") == [(old["id"],)]
+    assert sql(db, "SELECT DISTINCT contract_id FROM payments") == [(recent["id"],)]
+    assert sql_value(db, "SELECT count(*) FROM payments_archive WHERE contract_id = :id", id=old["id"]) == 2
+    assert sql(db, "SELECT contract_id FROM insurances") == [(recent["id"],)]
+    assert sql(db, "SELECT contract_id FROM insurances_archive") == [(old["id"],)]
+    # Сводки охватывают всю историю, включая архив
+    assert sql(db, SUMMARIES) == summaries
+
+def test_archive_skips_active_and_recent_contracts(client, db):
+    owner = create_client(client)
+    car = create_car(client)
+    create_contract(client, owner["id"], car["id"], "2020-01-01", "2020-01-10")
+
+    assert archive_contracts(db, date(2022, 1, 1)) == 0
+    assert sql_value(db, "SELECT count(*) FROM contracts") == 1
@@ -0,0 +1,39 @@
+from conftest import create_car, create_client, create_contract
+
+def available(client, start: str, end: str):
+    response = client.get("/available-cars", params={"start": start, "end": end})
+    assert response.status_code == 200, response.text
+    return [car["id"] for car in response.json()]
+
+# Свободны автомобили без активных договоров, пересекающих период
+# (границы включительно); завершённые договоры не занимают автомобиль
+def test_available_cars_exclude_overlapping_active_contracts(client, db):
+    owner = create_client(client)
+    rented, completed, free = (create_car(client, f"A{i}")["id"] for i in range(3))
+    create_contract(client, owner["id"], rented, "2024-01-10", "2024-01-20")
+    done = create_contract(client, owner["id"], completed, "2024-01-10", "2024-01-20")
+    assert client.put(f"/contracts/{done['id']}/complete").status_code == 200
+
+    assert available(client, "2024-01-01", "2024-01-09") == [rented, completed, free]
+    assert available(client, "2024-01-01", "2024-01-10") == [completed, free]
+    assert available(client, "2024-01-20", "2024-01-25") == [completed, free]
+    assert available(client, "2024-01-21", "2024-01-25") == [rented, completed, free]
+
+def test_available_cars_reject_reversed_period(client, db):
+    assert client.get("/available-cars", params={"start": "2024-01-10", "end": "2024-01-01"}).status_code == 400
+
+# Среди нескольких договоров автомобиля период сверяется с последним,
+# начатым не позже конца периода; завершённый договор в расчёт не идёт
+def test_available_cars_with_several_contracts_per_car(client, db):
+    owner = create_client(client)
+    car = create_car(client)["id"]
+    create_contract(client, owner["id"], car, "2024-01-01", "2024-01-05")
+    create_contract(client, owner["id"], car, "2024-01-08", "2024-01-09")
+    later = create_contract(client, owner["id"], car, "2024-01-15", "2024-01-20")
+    assert client.put(f"/contracts/{later['id']}/complete").status_code == 200
+
+    assert available(client, "2024-01-04", "2024-01-06") == []
+    assert available(client, "2024-01-06", "2024-01-07") == [car]
+    assert available(client, "2024-01-06", "2024-01-08") == []
+    assert available(client, "2024-01-10", "2024-01-16") == [car]
+    assert available(client, "2024-01-03", "2024-01-16") == []
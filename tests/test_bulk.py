@@ -0,0 +1,43 @@
+from conftest import create_car, create_client, create_contract, sql
+
+# id из RETURNING раздаются элементам по порядку параметров, ошибочные
+# элементы пропускаются
+def test_bulk_clients_ids_follow_input_order(client, db):
+    create_client(client, "TAKEN")
+    payload = [
+        {"full_name": f"Client {i}", "phone": "+7", "license_number": f"B{i}", "birth_date": "1990-01-01"}
+        for i in range(50)
+    ]
+    payload.insert(10, {"full_name": "Dup", "phone": "+7", "license_number": "TAKEN", "birth_date": "1990-01-01"})
+    results = client.post("/clients/bulk", json=payload).json()
+
+    assert results[10]["error"] and results[10]["id"] is None
+    stored = dict(sql(db, "SELECT id, license_number FROM clients"))
+    for item, result in zip(payload, results):
+        if result["error"] is None:
+            assert stored[result["id"]] == item["license_number"]
+
+def test_bulk_payments_ids_follow_input_order(client, db):
+    owner = create_client(client)
+    car = create_car(client)
+    contract = create_contract(client, owner["id"], car["id"], "2024-01-01", "2024-12-31")
+    # Даты из разных месяцев: строки попадают в разные секции payments
+    payload = [
+        {"contract_id": contract["id"], "date": f"2024-{month:02d}-01", "amount": float(month)}
+        for month in (12, 1, 7, 3, 11, 2)
+    ]
+    results = client.post("/payments/bulk", json=payload).json()
+
+    stored = dict(sql(db, "SELECT id, amount FROM payments"))
+    assert [stored[r["id"]] for r in results] == [p["amount"] for p in payload]
+
+def test_bulk_cars_resolve_brand_and_model(client, db):
+    payload = [
+        {"brand": "Kia", "model": "Rio", "year": 2020, "color": "white", "plate": f"K{i}", "price": 1.0}
+        for i in range(3)
+    ]
+    results = client.post("/cars/bulk", json=payload).json()
+
+    assert all(r["error"] is None for r in results)
+    cars = client.get("/cars").json()
+    assert {(c["license_plate"], c["brand"], c["model"]) for c in cars} == {(f"K{i}", "Kia", "Rio") for i in range(3)}
@@ -0,0 +1,37 @@
+from conftest import create_car, sql
+
+# Марку удалили в обход этого процесса: id в его кэше устарел, вставка
+# нарушает внешний ключ, и запись повторяется с id из базы
+def delete_brand_elsewhere(client, db, name: str):
+    assert client.post("/brands", json={"name": name}).status_code == 200
+    car = create_car(client, "C0", brand=name)
+    sql(db, "DELETE FROM cars WHERE id = :id", id=car["id"])
+    sql(db, "DELETE FROM brands WHERE name = :name", name=name)
+
+def test_create_car_recovers_from_stale_brand_id(client, db):
+    delete_brand_elsewhere(client, db, "Kia")
+
+    car = create_car(client, "C1", brand="Kia")
+
+    assert car["brand"] == "Kia"
+    assert sql(db, "SELECT b.name FROM cars c JOIN brands b ON b.id = c.brand_id") == [("Kia",)]
+
+def test_bulk_cars_recover_from_stale_brand_id(client, db):
+    delete_brand_elsewhere(client, db, "Kia")
+    payload = [
+        {"brand": "Kia", "model": "Rio", "year": 2020, "color": "white", "plate": f"K{i}", "price": 1.0}
+        for i in range(2)
+    ]
+
+    results = client.post("/cars/bulk", json=payload).json()
+
+    assert [r["error"] for r in results] == [None, None]
+    assert sql(db, "SELECT count(*) FROM cars c JOIN brands b ON b.id = c.brand_id WHERE b.name = 'Kia'") == [(2,)]
+
+def test_duplicate_plate_is_still_rejected(client, db):
+    create_car(client, "C1")
+    response = client.post("/cars", json={
+        "brand": "Lada", "model": "Vesta", "year": 2020, "color": "white", "plate": "C1", "price": 1.0,
+    })
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Car with this plate already exists"
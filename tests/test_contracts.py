@@ -0,0 +1,45 @@
+from conftest import create_car, create_client, create_contract
+
+def contract_payload(client_id: int, car_id: int, start: str, end: str):
+    return {
+        "client_id": client_id, "car_id": car_id, "start_date": start, "end_date": end,
+        "payment_date": start, "amount": 1000.0,
+    }
+
+# Пересечение активных договоров одного автомобиля отклоняет ограничение
+# contracts_car_period_excl; ответ — 409, а не 500
+def test_overlapping_active_contract_is_conflict(client, db):
+    owner = create_client(client)
+    car = create_car(client)
+    first = create_contract(client, owner["id"], car["id"], "2024-01-01", "2024-01-10")
+
+    # Границы включительно: договор с первого дня окончания уже пересекается
+    response = client.post("/contracts", json=contract_payload(owner["id"], car["id"], "2024-01-10", "2024-01-20"))
+    assert response.status_code == 409, response.text
+
+    second = create_contract(client, owner["id"], car["id"], "2024-01-11", "2024-01-20")
+    response = client.put(f"/contracts/{second['id']}", json=contract_payload(owner["id"], car["id"], "2024-01-05", "2024-01-20"))
+    assert response.status_code == 409, response.text
+
+    # Завершённый договор не мешает новому на те же даты
+    assert client.put(f"/contracts/{first['id']}/complete").status_code == 200
+    create_contract(client, owner["id"], car["id"], "2024-01-01", "2024-01-10")
+
+def test_other_car_may_be_rented_for_same_dates(client, db):
+    owner = create_client(client)
+    car = create_car(client, "A1")
+    other = create_car(client, "A2")
+    create_contract(client, owner["id"], car["id"], "2024-01-01", "2024-01-10")
+    create_contract(client, owner["id"], other["id"], "2024-01-01", "2024-01-10")
+
+# Завершение — один условный UPDATE: повторное завершение даёт 409
+def test_complete_contract_once(client, db):
+    owner = create_client(client)
+    car = create_car(client)
+    contract = create_contract(client, owner["id"], car["id"], "2024-01-01", "2024-01-10")
+
+    response = client.put(f"/contracts/{contract['id']}/complete")
+    assert response.status_code == 200
+    assert response.json()["status"] == "completed"
+    assert client.put(f"/contracts/{contract['id']}/complete").status_code == 409
+    assert client.put("/contracts/999999/complete").status_code == 404
@@ -0,0 +1,16 @@
+import pytest
+
+from backend.database import async_database_url
+
+@pytest.mark.parametrize("url", [
+    "postgresql://user:secret@db:5432/rental",
+    "postgresql+psycopg2://user:secret@db:5432/rental",
+    "postgresql+psycopg://user:secret@db:5432/rental",
+    "postgres://user:secret@db:5432/rental",
+])
+def test_async_url_uses_asyncpg_for_any_dsn(url):
+    async_url = async_database_url(url)
+    assert async_url.drivername == "postgresql+asyncpg"
+    assert (async_url.username, async_url.password, async_url.host, async_url.port, async_url.database) == (
+        "user", "secret", "db", 5432, "rental",
+    )
@@ -0,0 +1,43 @@
+from conftest import sql
+
+def test_unchanged_list_revalidates_with_304(client, db):
+    client.post("/brands", json={"name": "Lada"})
+    first = client.get("/brands")
+    etag = first.headers["ETag"]
+
+    again = client.get("/brands", headers={"If-None-Match": etag})
+
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+
+def test_etag_depends_on_query(client, db):
+    client.post("/brands", json={"name": "Lada"})
+    assert client.get("/brands").headers["ETag"] != client.get("/brands?limit=1").headers["ETag"]
+
+# Запись другим процессом (другой воркер, импорт) не сбрасывает кэш этого
+# процесса, но меняет версию таблицы: страница перечитывается вместе с ETag
+def test_cached_list_follows_writes_from_other_connections(client, db):
+    stale = client.get("/brands")
+    assert stale.json() == []
+
+    sql(db, "INSERT INTO brands (name) VALUES ('Kia')")
+    fresh = client.get("/brands", headers={"If-None-Match": stale.headers["ETag"]})
+
+    assert fresh.status_code == 200
+    assert [b["name"] for b in fresh.json()] == ["Kia"]
+    assert fresh.headers["ETag"] != stale.headers["ETag"]
+    assert client.get("/brands", headers={"If-None-Match": fresh.headers["ETag"]}).status_code == 304
+
+def test_write_through_api_changes_etag(client, db):
+    owner = client.post("/clients", json={
+        "full_name": "Ivan", "phone": "+7", "license_number": "L1", "birth_date": "1990-01-01",
+    }).json()
+    etag = client.get("/clients").headers["ETag"]
+    client.put(f"/clients/{owner['id']}", json={
+        "full_name": "Ivan Petrov", "phone": "+7", "license_number": "L1", "birth_date": "1990-01-01",
+    })
+
+    response = client.get("/clients", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.json()[0]["full_name"] == "Ivan Petrov"
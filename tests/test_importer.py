@@ -0,0 +1,69 @@
+from backend.importer import import_csv
+from conftest import create_car, create_client, create_contract, sql, sql_value
+
+CONTRACT_HEADER = "client_license_number,car_plate,start_date,end_date,payment_date,amount,status\n"
+PAYMENT_HEADER = "client_license_number,car_plate,contract_start_date,date,amount\n"
+
+def write_csv(tmp_path, name: str, header: str, lines):
+    path = tmp_path / name
+    path.write_text(header + "".join(line + "\n" for line in lines), encoding="utf-8")
+    return str(path)
+
+def test_contract_import_rejects_overlaps_within_file(client, db, tmp_path):
+    create_client(client, "L1")
+    create_car(client, "A1")
+    create_car(client, "A2")
+    path = write_csv(tmp_path, "contracts.csv", CONTRACT_HEADER, [
+        "L1,A1,2024-01-01,2024-01-10,2024-01-01,100,active",
+        "L1,A1,2024-01-05,2024-01-15,2024-01-05,100,active",
+        "L1,A1,2024-01-05,2024-01-15,2024-01-05,100,completed",
+        "L1,A2,2024-01-01,2024-01-10,2024-01-01,100,",
+        "L9,A2,2024-02-01,2024-02-10,2024-02-01,100,active",
+    ])
+
+    report = import_csv("contracts", path)
+
+    assert report["inserted"] == 2
+    assert report["rejected"]["overlaps_in_file"] == 2
+    assert report["rejected"]["unknown_client"] == 1
+    assert report["rejected_rows"] == {"overlaps_in_file": [1, 2], "unknown_client": [5]}
+    assert sql(db, "SELECT status, start_date::text FROM contracts ORDER BY id") == [
+        ("completed", "2024-01-05"), ("active", "2024-01-01"),
+    ]
+
+def test_contract_import_rejects_overlap_with_existing(client, db, tmp_path):
+    owner = create_client(client, "L1")
+    car = create_car(client, "A1")
+    create_contract(client, owner["id"], car["id"], "2024-01-01", "2024-01-10")
+    path = write_csv(tmp_path, "contracts.csv", CONTRACT_HEADER, [
+        "L1,A1,2024-01-10,2024-01-20,2024-01-10,100,active",
+    ])
+
+    report = import_csv("contracts", path)
+
+    assert report["inserted"] == 0
+    assert report["rejected"]["overlaps_active"] == 1
+
+def test_payment_import_requires_unique_contract(client, db, tmp_path):
+    owner = create_client(client, "L1")
+    car = create_car(client, "A1")
+    other = create_car(client, "A2")
+    # Два договора одного клиента на один автомобиль с одной датой начала
+    first = create_contract(client, owner["id"], car["id"], "2024-01-01", "2024-01-05")
+    client.put(f"/contracts/{first['id']}/complete")
+    create_contract(client, owner["id"], car["id"], "2024-01-01", "2024-01-05")
+    single = create_contract(client, owner["id"], other["id"], "2024-03-01", "2024-03-05")
+    path = write_csv(tmp_path, "payments.csv", PAYMENT_HEADER, [
+        "L1,A1,2024-01-01,2024-01-02,100",
+        "L1,A2,2024-03-01,2024-03-02,50",
+        "L1,A2,2024-04-01,2024-04-02,10",
+        "L1,A2,2024-03-01,,10",
+    ])
+
+    report = import_csv("payments", path)
+
+    assert report["inserted"] == 1
+    assert report["rejected"] == {"unknown_contract": 1, "ambiguous_contract": 1, "missing_date": 1}
+    assert report["rejected_rows"]["ambiguous_contract"] == [1]
+    assert sql(db, "SELECT contract_id, amount FROM payments") == [(single["id"], 50.0)]
+    assert sql_value(db, "SELECT count(*) FROM payments WHERE contract_id = :id", id=first["id"]) == 0
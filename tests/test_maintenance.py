@@ -0,0 +1,41 @@
+from conftest import create_car, sql
+
+def add_service(client, car_id: int, day: str, cost: float):
+    response = client.post("/maintenances", json={"car_id": car_id, "description": "Oil change", "date": day, "cost": cost})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def by_car(client):
+    return {
+        row["car"]["id"]: (row["services_count"], row["total_cost"], row["last_date"])
+        for row in client.get("/analytics/maintenance/cars").json()
+    }
+
+def by_month(client):
+    return {
+        row["month"]: (row["services_count"], row["total_cost"])
+        for row in client.get("/analytics/maintenance/monthly").json()
+        if row["services_count"]
+    }
+
+# Триггер на maintenances поддерживает сводки при вставке, изменении и
+# удалении, включая дату последнего обслуживания
+def test_maintenance_rollups_follow_writes(client, db):
+    car = create_car(client, "A1")
+    other = create_car(client, "A2")
+    add_service(client, car["id"], "2024-01-05", 100.0)
+    latest = add_service(client, car["id"], "2024-02-10", 200.0)
+
+    assert by_car(client) == {car["id"]: (2, 300.0, "2024-02-10")}
+    assert by_month(client) == {"2024-01-01": (1, 100.0), "2024-02-01": (1, 200.0)}
+
+    response = client.put(f"/maintenances/{latest['id']}", json={
+        "car_id": other["id"], "description": "Tyres", "date": "2024-03-01", "cost": 50.0,
+    })
+    assert response.status_code == 200, response.text
+    assert by_car(client) == {car["id"]: (1, 100.0, "2024-01-05"), other["id"]: (1, 50.0, "2024-03-01")}
+    assert by_month(client) == {"2024-01-01": (1, 100.0), "2024-03-01": (1, 50.0)}
+
+    assert client.delete(f"/maintenances/{latest['id']}").status_code == 200
+    assert by_car(client)[other["id"]] == (0, 0.0, None)
+    assert sql(db, "SELECT services_count FROM maintenance_by_month WHERE month = '2024-03-01'") == [(0,)]
@@ -0,0 +1,29 @@
+import logging
+
+import pytest
+
+from backend.migrations import MIGRATIONS, pending_migrations, prepare_database, stamp
+from backend.models import Base
+from conftest import sql
+
+# Отметка миграции снимается на время теста и восстанавливается stamp
+@pytest.fixture
+def unapplied(engine):
+    def unapply(version: int):
+        sql(engine, "DELETE FROM schema_migrations WHERE version = :version", version=version)
+    yield unapply
+    stamp(engine)
+
+def test_fresh_database_has_no_pending_migrations(engine):
+    assert pending_migrations(engine) == []
+
+def test_startup_refuses_pending_trigger_migration(engine, unapplied):
+    unapplied(4)
+    with pytest.raises(RuntimeError, match="4:table_version_triggers"):
+        prepare_database(engine, Base.metadata)
+
+def test_startup_only_warns_about_pending_indexes(engine, unapplied, caplog):
+    unapplied(1)
+    with caplog.at_level(logging.WARNING, logger="backend.migrations"):
+        prepare_database(engine, Base.metadata)
+    assert f"1:{MIGRATIONS[0][1]}" in caplog.text
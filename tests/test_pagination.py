@@ -0,0 +1,53 @@
+from conftest import create_car, create_client, create_contract
+
+# Обход всех страниц по курсору X-Next-Cursor
+def walk(client, path: str, limit: int, **params):
+    pages, after = [], None
+    while True:
+        query = dict(params, limit=limit)
+        if after is not None:
+            query["after"] = after
+        response = client.get(path, params=query)
+        assert response.status_code == 200, response.text
+        pages.append([item["id"] for item in response.json()])
+        after = response.headers.get("X-Next-Cursor")
+        if after is None:
+            return pages
+
+def test_keyset_pages_cover_list_once(client, db):
+    ids = [create_client(client, f"L{i}")["id"] for i in range(7)]
+
+    pages = walk(client, "/clients", 3)
+
+    assert pages == [ids[0:3], ids[3:6], ids[6:7]]
+    # Ровно limit записей: следующей страницы нет, курсор не выдаётся
+    response = client.get("/clients", params={"limit": 7})
+    assert "X-Next-Cursor" not in response.headers
+
+# Строки, добавленные между запросами страниц, не сдвигают уже выданные
+def test_keyset_pages_are_stable_under_inserts(client, db):
+    ids = [create_client(client, f"L{i}")["id"] for i in range(4)]
+    first = client.get("/clients", params={"limit": 2})
+    added = create_client(client, "L-new")["id"]
+
+    second = client.get("/clients", params={"limit": 2, "after": first.headers["X-Next-Cursor"]})
+
+    assert [c["id"] for c in first.json()] == ids[:2]
+    assert [c["id"] for c in second.json()] == ids[2:4]
+    assert walk(client, "/clients", 10) == [ids + [added]]
+
+def test_filters_apply_before_pagination(client, db):
+    owner = create_client(client)
+    cars = [create_car(client, f"A{i}") for i in range(2)]
+    for month in range(1, 6):
+        for car in cars:
+            create_contract(client, owner["id"], car["id"], f"2024-{month:02d}-01", f"2024-{month:02d}-10")
+    expected = [
+        c["id"] for c in client.get("/contracts").json()
+        if c["car"]["id"] == cars[1]["id"] and "2024-02-01" <= c["start_date"] <= "2024-04-30"
+    ]
+
+    pages = walk(client, "/contracts", 2, car_id=cars[1]["id"], date_from="2024-02-01", date_to="2024-04-30")
+
+    assert len(expected) == 3
+    assert [i for page in pages for i in page] == expected
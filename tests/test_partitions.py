@@ -0,0 +1,83 @@
+from datetime import date
+
+import pytest
+
+from backend.archive import create_payment_partitions
+from backend.importer import import_csv
+from conftest import create_car, create_client, create_contract, sql, sql_value
+
+# Секция, в которой лежит платёж (tableoid — секция строки)
+def partition_of(db, payment_id: int):
+    return sql_value(db, "SELECT tableoid::regclass::text FROM payments WHERE id = :id", id=payment_id)
+
+def test_payments_are_routed_to_monthly_partitions(client, db):
+    owner = create_client(client)
+    car = create_car(client)
+    today = date.today()
+    contract = create_contract(client, owner["id"], car["id"], today.isoformat(), today.isoformat())
+    response = client.post("/payments", json={"contract_id": contract["id"], "date": today.isoformat(), "amount": 10.0})
+    assert response.status_code == 200, response.text
+
+    partition = f"payments_p{today:%Y_%m}"
+    assert partition_of(db, response.json()["id"]) == partition
+    # Фильтр по дате отсекает остальные секции
+    plan = sql(db, "EXPLAIN SELECT * FROM payments WHERE date = :day", day=today)
+    plan = "\n".join(row[0] for row in plan)
+    assert partition in plan and "payments_default" not in plan
+
+# Платёж задним числом попадает в payments_default; очередной запуск
+# создания секций переносит его в секцию месяца, сводки не меняются
+def test_backdated_payments_move_out_of_default(client, db):
+    owner = create_client(client)
+    car = create_car(client)
+    contract = create_contract(client, owner["id"], car["id"], "2019-05-01", "2019-05-10")
+    response = client.post("/payments", json={"contract_id": contract["id"], "date": "2019-05-02", "amount": 10.0})
+    assert response.status_code == 200, response.text
+    payment = response.json()
+    assert partition_of(db, payment["id"]) == "payments_default"
+    summaries = sql(db, "SELECT * FROM revenue_by_month ORDER BY month")
+
+    assert create_payment_partitions(db) >= 1
+
+    assert partition_of(db, payment["id"]) == "payments_p2019_05"
+    assert sql_value(db, "SELECT count(*) FROM payments_default") == 0
+    assert sql(db, "SELECT * FROM revenue_by_month ORDER BY month") == summaries
+    assert sql(db, "SELECT contract_id, amount FROM payments") == [(contract["id"], 10.0)]
+
+def test_imported_history_gets_monthly_partitions(client, db, tmp_path):
+    owner = create_client(client, "L1")
+    car = create_car(client, "A1")
+    create_contract(client, owner["id"], car["id"], "2018-01-01", "2018-03-31")
+    path = tmp_path / "payments.csv"
+    path.write_text(
+        "client_license_number,car_plate,contract_start_date,date,amount\n"
+        "L1,A1,2018-01-01,2018-01-15,10\n"
+        "L1,A1,2018-01-01,2018-03-15,20\n",
+        encoding="utf-8",
+    )
+
+    assert import_csv("payments", str(path))["inserted"] == 2
+
+    assert sql(db, "SELECT tableoid::regclass::text FROM payments ORDER BY date") == [
+        ("payments_p2018_01",), ("payments_p2018_03",),
+    ]
+    assert sql_value(db, "SELECT count(*) FROM revenue_by_month WHERE payments_count > 0") == 2
+
+# Секции создаются и фиксируются до транзакции загрузки: ошибка COPY их не
+# откатывает, а блокировка ATTACH PARTITION не держится всю загрузку
+def test_import_creates_partitions_in_separate_transaction(client, db, tmp_path):
+    path = tmp_path / "payments.csv"
+    path.write_text(
+        "client_license_number,car_plate,contract_start_date,date,amount\n"
+        "L1,A1,2017-06-01,2017-06-15,10\n"
+        "L1,A1,2017-06-01,2017-08-15,not-a-number\n",
+        encoding="utf-8",
+    )
+
+    with pytest.raises(Exception):
+        import_csv("payments", str(path))
+
+    assert sql(db, """
+        SELECT relname::text FROM pg_class WHERE relname IN ('payments_p2017_06', 'payments_p2017_07', 'payments_p2017_08')
+        ORDER BY relname
+    """) == [("payments_p2017_06",), ("payments_p2017_07",), ("payments_p2017_08",)]
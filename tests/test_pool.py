@@ -0,0 +1,43 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from backend.database import InstrumentedQueuePool, PoolStats
+from conftest import TEST_DATABASE_URL
+
+class CountingPool(InstrumentedQueuePool):
+    stats = PoolStats()
+
+@pytest.fixture
+def pool_engine(engine):
+    CountingPool.stats = PoolStats()
+    engine = create_engine(TEST_DATABASE_URL, poolclass=CountingPool, pool_size=1, max_overflow=0, pool_timeout=5)
+    yield engine
+    engine.dispose()
+
+# Открытие нового соединения в свободном пуле — не ожидание
+def test_opening_connection_is_not_pool_wait(pool_engine):
+    with pool_engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    with pool_engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+    assert CountingPool.stats.waits == 0
+
+# Получение из исчерпанного пула ждёт возврата соединения
+def test_blocked_checkout_is_pool_wait(pool_engine):
+    holder = pool_engine.connect()
+
+    def release():
+        time.sleep(0.2)
+        holder.close()
+
+    threading.Thread(target=release).start()
+    with pool_engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+    stats = CountingPool.stats.snapshot(pool_engine.pool)
+    assert stats["waits"] == 1
+    assert stats["wait_max_ms"] >= 150
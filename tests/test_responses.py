@@ -0,0 +1,52 @@
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter
+
+from backend.main import app
+from conftest import create_car, create_client, create_contract
+
+# Обработчики отдают готовые словари (fast_json) в обход response_model:
+# ответы сверяются со схемами — те же поля, без лишних, те же значения
+# после проверки и сериализации схемой
+def assert_matches_schema(route: APIRoute, data):
+    adapter = TypeAdapter(route.response_model)
+    assert adapter.dump_python(adapter.validate_python(data), mode="json") == data, route.path
+
+def route_for(method: str, path: str) -> APIRoute:
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.path == path and method in route.methods:
+            return route
+    raise KeyError(path)
+
+# Обязательные параметры запроса для маршрутов, которые без них не вызвать
+QUERY = {
+    "/clients/search": {"q": "Client"},
+    "/cars/search": {"q": "A1"},
+}
+
+def test_responses_match_response_models(client, db):
+    owner = create_client(client)
+    car = create_car(client, "A1")
+    contract = create_contract(client, owner["id"], car["id"], "2024-01-01", "2024-01-10")
+    writes = [
+        ("POST", "/payments", {"contract_id": contract["id"], "date": "2024-01-02", "amount": 10.0}),
+        ("POST", "/insurances", {"contract_id": contract["id"], "cost": 5.0}),
+        ("POST", "/maintenances", {"car_id": car["id"], "description": "Oil", "date": "2024-01-03", "cost": 7.0}),
+        ("POST", "/parkings", {"name": "Parking 1"}),
+        ("POST", "/employees", {"full_name": "Employee 1"}),
+        ("PUT", "/contracts/{contract_id}/complete", None),
+    ]
+    for method, path, body in writes:
+        response = client.request(method, path.format(contract_id=contract["id"]), json=body)
+        assert response.status_code == 200, response.text
+        assert_matches_schema(route_for(method, path), response.json())
+
+    checked = 0
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or route.response_model is None or "GET" not in route.methods:
+            continue
+        response = client.get(route.path, params=QUERY.get(route.path, {}))
+        assert response.status_code == 200, (route.path, response.text)
+        assert response.json(), route.path
+        assert_matches_schema(route, response.json())
+        checked += 1
+    assert checked >= 15
@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from backend import slow_queries
+from backend.slow_queries import SlowQueryLog, attach_slow_query_log, is_select
+from conftest import TEST_DATABASE_URL, sql, sql_value
+
+# Функция с побочным эффектом, которую можно вызвать через SELECT
+BUMP_FUNCTION = """
+CREATE OR REPLACE FUNCTION slow_query_test_bump() RETURNS integer AS $$
+    INSERT INTO brands (name) VALUES (gen_random_uuid()::text) RETURNING id
+$$ LANGUAGE sql
+"""
+
+# Отдельный движок, на котором любой запрос считается медленным и объясняется
+@pytest.fixture
+def logged_engine(db, monkeypatch):
+    log = SlowQueryLog(threshold_ms=0.001, explain_ms=0, explain_interval=0, size=50)
+    monkeypatch.setattr(slow_queries, "slow_query_log", log)
+    engine = create_engine(TEST_DATABASE_URL)
+    attach_slow_query_log(engine)
+    sql(db, BUMP_FUNCTION)
+    yield engine, log
+    engine.dispose()
+    sql(db, "DROP FUNCTION slow_query_test_bump()")
+
+def plans(log, statement: str):
+    return [e["plan"] for e in log.entries(50)["entries"] if e["statement"] == statement]
+
+# Повторное выполнение под EXPLAIN ANALYZE откатывается: побочный эффект
+# запроса фиксируется один раз
+def test_explain_does_not_repeat_side_effects(db, logged_engine):
+    engine, log = logged_engine
+    with engine.begin() as conn:
+        conn.execute(text("SELECT slow_query_test_bump()"))
+
+    assert sql_value(db, "SELECT count(*) FROM brands") == 1
+    [plan] = plans(log, "SELECT slow_query_test_bump()")
+    assert plan.startswith("Result")
+
+# В режиме AUTOCOMMIT нет транзакции для SAVEPOINT: запрос записывается в
+# журнал без плана, а выполнение не прерывается
+def test_explain_skipped_without_transaction(db, logged_engine):
+    engine, log = logged_engine
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        assert conn.execute(text("SELECT slow_query_test_bump()")).scalar() is not None
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+
+    assert sql_value(db, "SELECT count(*) FROM brands") == 1
+    assert plans(log, "SELECT slow_query_test_bump()") == [None]
+
+def test_is_select_skips_sequence_calls():
+    assert is_select("  select id from cars")
+    assert not is_select("SELECT setval('payments_id_seq', 10)")
+    assert not is_select("UPDATE cars SET price = 1")
@@ -0,0 +1,51 @@
+from datetime import date
+
+import numpy as np
+
+from backend.utilization import merged_intervals, utilization_report
+
+def intervals(*items):
+    cars, starts, ends = zip(*items)
+    return np.array(cars, dtype=np.int64), np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64)
+
+def periods(car_ids, cars, starts, ends, days: int):
+    rows, starts, ends = merged_intervals(np.array(car_ids, dtype=np.int64), cars, starts, ends, days)
+    return sorted(zip(rows.tolist(), starts.tolist(), ends.tolist()))
+
+def test_intervals_are_clipped_to_window():
+    assert periods([1, 2], *intervals((1, -5, 1), (2, 3, 20)), 5) == [(0, 0, 1), (1, 3, 4)]
+
+# Пересекающиеся и идущие подряд договоры одного автомобиля сливаются,
+# договоры разных автомобилей — нет
+def test_intervals_of_one_car_are_merged():
+    data = intervals((1, 0, 3), (1, 2, 5), (1, 6, 7), (1, 9, 9), (2, 0, 9))
+    assert periods([1, 2], *data, 10) == [(0, 0, 7), (0, 9, 9), (1, 0, 9)]
+
+# Договоры целиком до или после окна, неизвестные автомобили и интервалы с
+# концом раньше начала не занимают ни одного дня
+def test_intervals_outside_window_are_ignored():
+    data = intervals((1, -10, -1), (1, 5, 9), (2, 7, 3), (3, 0, 4), (2, 2, 2))
+    assert periods([1, 2], *data, 5) == [(1, 2, 2)]
+
+def test_report_without_contracts():
+    empty = np.array([], dtype=np.int64)
+    report = utilization_report(np.array([1], dtype=np.int64), empty, empty, empty, date(2024, 1, 1), 3, True)
+    assert report["cars"] == [{"car_id": 1, "rented_days": 0, "utilization": 0.0}]
+    assert [day["rented_cars"] for day in report["daily"]] == [0, 0, 0]
+
+# Сверка с матрицей занятости автомобили x дни на случайных данных
+def test_report_matches_dense_occupancy():
+    rng = np.random.default_rng(1)
+    days, car_ids = 60, np.arange(1, 21, dtype=np.int64)
+    cars = rng.integers(1, 23, 500)
+    starts = rng.integers(-20, days + 10, 500)
+    ends = starts + rng.integers(-2, 15, 500)
+    occupied = np.zeros((len(car_ids), days), dtype=bool)
+    for car, s, e in zip(cars, starts, ends):
+        if car <= len(car_ids) and e >= max(s, 0):
+            occupied[car - 1, max(s, 0):min(e, days - 1) + 1] = True
+
+    report = utilization_report(car_ids, cars, starts, ends, date(2024, 1, 1), days, True)
+
+    assert [c["rented_days"] for c in report["cars"]] == occupied.sum(axis=1).tolist()
+    assert [d["rented_cars"] for d in report["daily"]] == occupied.sum(axis=0).tolist()